@@ -0,0 +1,281 @@
+import argparse
+import inspect
+import json
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from loading import DatasetCache, get_default_path, load_all_stored_datasets, split_file_name
+from suites import generator_key, suite_config
+from storage import csv_file
+
+# multiples of the default length of generators with an iterations argument
+length_scales = {"quick": [1], "full": [1, 10, 100]}
+# periods of the Lotka-Volterra generators with a periods argument, 1000 steps per period
+lotka_volterra_periods = {"quick": [11], "full": [11, 101, 1001]}
+# loader arguments of the measured loading modes
+loading_modes = {"quick": {"default": {}},
+                 "full": {"default": {}, "compact": {"compact": True, "value_dtype": "float32"}}}
+# calls of fast generators are repeated until their total time reaches this budget
+min_seconds = 0.2
+# a change is reported as regression when it takes this factor more time or memory
+regression_factor = 1.2
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def _time_call(f, kwargs, seed, repeat):
+    """
+    Best wall time of at least repeat calls and min_seconds in total, each starting from the same random state
+    """
+    times = []
+    while len(times) < repeat or sum(times) < min_seconds:
+        np.random.seed(seed)
+        start = time.perf_counter()
+        result = f(**kwargs)
+        times.append(time.perf_counter() - start)
+    return min(times), len(times), result
+
+
+def _peak_memory(f, kwargs, seed):
+    """
+    Peak of the memory allocated during one call, as traced by tracemalloc
+    """
+    np.random.seed(seed)
+    tracemalloc.start()
+    try:
+        f(**kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _length_arguments(f, mode):
+    """
+    Generator arguments of the measured lengths, None for the multiples of the default length
+    """
+    parameters = inspect.signature(f).parameters
+    if "periods" in parameters:
+        return [{"periods": p} for p in lotka_volterra_periods[mode]]
+    if "iterations" in parameters:
+        return [None for _ in length_scales[mode]]
+    return [{}]
+
+
+def bench_generators(suite, mode="quick", repeat=1, memory=True, seed=0):
+    """
+    Wall time and peak memory of every generator of a suite at several sequence lengths
+    :param suite: Name of the benchmark suite: 'FSB' or 'SRB'
+    :param mode: 'quick' for the default lengths only or 'full'
+    :param repeat: Number of calls per measurement, the fastest one counts
+    :param memory: Measure the peak memory in an additional traced call
+    :param seed: Seed of the random stream before each call
+    :return: List of result dicts
+    """
+    results = []
+    for f in suite_config[suite]:
+        base = None
+        for scale, kwargs in zip(length_scales[mode], _length_arguments(f, mode)):
+            if kwargs is None:
+                kwargs = {} if base is None else {"iterations": base * scale}
+            seconds, calls, (df, params, group) = _time_call(f, kwargs, seed, repeat)
+            if base is None:
+                base = params.get("iterations", len(df)) if isinstance(params, dict) else len(df)
+            elif len(df) == results[-1]["rows"]:
+                # the generator has a fixed length
+                break
+            results.append({
+                "suite": suite, "generator": generator_key(f), "group": group, "arguments": kwargs,
+                "rows": len(df), "calls": calls, "seconds": seconds,
+                "rows_per_second": len(df) / seconds if seconds > 0 else None,
+                "peak_bytes": _peak_memory(f, kwargs, seed) if memory else None,
+            })
+            print(f"{group} {kwargs} {len(df)} rows {seconds:.3f}s")
+    return results
+
+
+def _stored_files(base_path: Path, group):
+    """
+    Files the loader reads for a group, the binary ones are preferred
+    """
+    files = []
+    for split in split_file_name.values():
+        path = base_path / group / split
+        if path.with_suffix(".npz").exists():
+            files.append(path.with_suffix(".npz"))
+        elif csv_file(path) is not None:
+            files.append(csv_file(path))
+    return files
+
+
+def _iterate(benchmark, cache, groups, kwargs):
+    """
+    Load the groups once, the rows and bytes count every distinct loaded sequence
+    """
+    rows = 0
+    seen = set()
+    start = time.perf_counter()
+    for _, _, train, test in load_all_stored_datasets(benchmark, cache=cache, groups=groups, **kwargs):
+        for sequence in (train, test):
+            if id(sequence) not in seen:
+                seen.add(id(sequence))
+                rows += len(sequence["timestamp"])
+    return time.perf_counter() - start, rows
+
+
+def bench_loading(benchmark, mode="quick"):
+    """
+    Throughput of load_all_stored_datasets with an empty (cold) and a filled (warm) cache,
+    and the cache behaviour when it only holds half of the loaded groups
+    :param benchmark: Name of the benchmark suite: 'fsb' or 'srb'
+    :param mode: 'quick' for the default loader and the short semi-realistic groups only or 'full'
+    :return: List of result dicts
+    """
+    base_path = Path(get_default_path(benchmark))
+    if not base_path.exists():
+        print(f"Benchmark suite {benchmark} not available, skipped")
+        return []
+    groups = sorted(p.name for p in base_path.iterdir() if p.is_dir() and not p.name.startswith("."))
+    if mode == "quick" and benchmark == "srb":
+        groups = [g for g in groups if "short" in g]
+    size = sum(p.stat().st_size for g in groups for p in _stored_files(base_path, g))
+
+    results = []
+    for name, kwargs in loading_modes[mode].items():
+        cache = DatasetCache(max_bytes=2 ** 62)
+        try:
+            passes = {"cold": _iterate(benchmark, cache, groups, kwargs)}
+            passes["warm"] = _iterate(benchmark, cache, groups, kwargs)
+        except (OSError, ValueError, KeyError, pd.errors.ParserError) as e:
+            print(f"Loading {benchmark} failed: {e}")
+            results.append({"suite": benchmark, "mode": name, "error": repr(e)})
+            continue
+        for label, (seconds, rows) in passes.items():
+            results.append({
+                "suite": benchmark, "mode": name, "pass": label, "groups": len(groups), "rows": rows,
+                "bytes": size, "seconds": seconds, "rows_per_second": rows / seconds if seconds > 0 else None,
+                "mb_per_second": size / 2 ** 20 / seconds if seconds > 0 and label == "cold" else None,
+                "cache": cache.stats(),
+            })
+            print(f"{benchmark} {name} {label}: {rows} rows {seconds:.3f}s")
+
+        # half of the groups fit, iterating twice in the same order evicts every group before its next use
+        half = DatasetCache(max_bytes=max(cache.size // 2, 1))
+        seconds = sum(_iterate(benchmark, half, groups, kwargs)[0] for _ in range(2))
+        results.append({"suite": benchmark, "mode": name, "pass": "half-cache", "groups": len(groups),
+                        "seconds": seconds, "cache": half.stats()})
+        print(f"{benchmark} {name} half-cache: {half.stats()}")
+
+        # persistent binary copies of the CSV files, created in the first pass and reused in the second
+        with tempfile.TemporaryDirectory() as cache_dir:
+            for label in ("cache-dir-cold", "cache-dir-warm"):
+                seconds, rows = _iterate(benchmark, DatasetCache(), groups, {**kwargs, "cache_dir": cache_dir})
+                results.append({"suite": benchmark, "mode": name, "pass": label, "groups": len(groups),
+                                "rows": rows, "seconds": seconds})
+                print(f"{benchmark} {name} {label}: {seconds:.3f}s")
+    return results
+
+
+def _key(result):
+    if "generator" in result:
+        return "generator", result["group"], json.dumps(result["arguments"], sort_keys=True)
+    return "loading", result["suite"], result["mode"], result.get("pass")
+
+
+def compare(previous, current):
+    """
+    Print the time and memory ratios of matching measurements of two runs, regressions are marked
+    :param previous: Results of the earlier run
+    :param current: Results of the later run
+    :return: Number of regressions
+    """
+    earlier = {_key(r): r for part in ("generators", "loading") for r in previous.get(part, [])}
+    regressions = 0
+    print(f"Compared to {previous['meta']['commit']} from {previous['meta']['time']}:")
+    for part in ("generators", "loading"):
+        for r in current.get(part, []):
+            before = earlier.get(_key(r))
+            if before is None or "seconds" not in r or "seconds" not in before:
+                continue
+            ratios = {"time": r["seconds"] / before["seconds"] if before["seconds"] > 0 else None}
+            if r.get("peak_bytes") and before.get("peak_bytes"):
+                ratios["memory"] = r["peak_bytes"] / before["peak_bytes"]
+            slower = [k for k, v in ratios.items() if v is not None and v > regression_factor]
+            regressions += len(slower) > 0
+            print(f"{'REGRESSION ' if slower else ''}{' '.join(map(str, _key(r)[1:]))}: "
+                  + ", ".join(f"{k} x{v:.2f}" for k, v in ratios.items() if v is not None))
+    return regressions
+
+
+def run(suites=("FSB", "SRB"), quick=True, repeat=None, memory=True):
+    """
+    Run all benchmarks
+    :param suites: Suites to benchmark: 'FSB' and/or 'SRB'
+    :param quick: Reduced run of about a minute, only the default lengths and the short semi-realistic groups
+    :param repeat: Number of calls per generator measurement, 1 in the quick mode and 3 otherwise by default
+    :param memory: Measure the peak memory of the generators
+    :return: Results with the run metadata
+    """
+    mode = "quick" if quick else "full"
+    if repeat is None:
+        repeat = 1 if quick else 3
+    results = {
+        "meta": {"commit": _git_commit(), "time": datetime.now(timezone.utc).isoformat(), "mode": mode,
+                 "repeat": repeat, "python": platform.python_version(), "numpy": np.__version__,
+                 "pandas": pd.__version__, "machine": platform.machine(), "processor": platform.processor()},
+        "generators": [],
+        "loading": [],
+    }
+    start = time.perf_counter()
+    for suite in suites:
+        results["generators"] += bench_generators(suite, mode, repeat, memory)
+    for suite in suites:
+        results["loading"] += bench_loading(suite.lower(), mode)
+    results["meta"]["seconds"] = time.perf_counter() - start
+    return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--suite", type=str, default="both", choices=['FSB', 'SRB', 'both'],
+                        help="Benchmark suite to measure the generators and loading of: 'FSB', 'SRB' or 'both'")
+    parser.add_argument("--quick", type=str, default="yes",
+                        help="Reduced run of about a minute with the default lengths only: 'yes' or 'no'")
+    parser.add_argument("--repeat", type=int, default=None,
+                        help="Number of calls per generator measurement, the fastest one counts")
+    parser.add_argument("--memory", type=str, default="yes",
+                        help="Measure the peak memory of the generators with tracemalloc: 'yes' or 'no'")
+    parser.add_argument("--output", type=str, default=None,
+                        help="JSON file to store the results in, benchmark-results/<commit>-<mode>.json by default")
+    parser.add_argument("--compare", type=str, default=None,
+                        help="JSON results of an earlier run to compare with")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    results = run(("FSB", "SRB") if args.suite == "both" else (args.suite,), args.quick == "yes", args.repeat,
+                  args.memory == "yes")
+    output = args.output
+    if output is None:
+        output = f"{Path(__file__).parent}/benchmark-results/{results['meta']['commit']}-{results['meta']['mode']}.json"
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=1)
+    print(f"Stored results in {output} after {results['meta']['seconds']:.1f}s")
+    if args.compare is not None:
+        with open(args.compare, "r") as f:
+            compare(json.load(f), results)
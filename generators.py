@@ -1,10 +1,11 @@
-import copy
 import os
+from operator import add
 
 import igraph as ig
 import numpy as np
 import pandas as pd
 from matplotlib import pyplot as plt
+from scipy.signal import lfilter
 
 
 def __simple_plot(t, data):
@@ -37,9 +38,97 @@ def __simple_df_plot(data):
     fig.show()
 
 
+def _compile_lotka_volterra(a, b, c, d):
+    """
+    Compile the sparse rate tuples of the predator prey generator into per species update terms
+    :param a: List, alpha, The rate at which prey birth exceeds natural death
+    :param b: List/Matrix(row=pred, col=prey), beta, The rate of predation
+    :param c: List, gamma, The rate at which predator deaths exceed births without food
+    :param d: List/Matrix(row=pred, col=prey), delta, Predator increase with the presence of food
+    :return: Dict with prey_terms [(prey, alpha, [(beta, predator), …]), …]
+             and pred_terms [(predator, gamma, [(delta, prey), …]), …]
+    """
+    # The update is accumulated term by term in the order of the original rate tuples,
+    # a matrix product would sum in a different order and break reproducibility
+    prey_terms = [(pyi, float(a_), [(float(bs_[pyi]), pdi) for pdi, bs_ in enumerate(b)
+                                    if bs_ is not None and bs_[pyi] is not None])
+                  for pyi, a_ in enumerate(a) if a_ is not None]
+    pred_terms = [(pdi, float(c_), [(float(ds_), pyi) for pyi, ds_ in enumerate(d[pdi]) if ds_ is not None])
+                  for pdi, c_ in enumerate(c) if c_ is not None]
+    return {"prey_terms": prey_terms, "pred_terms": pred_terms}
+
+
+def _lotka_volterra_steps(x, model, timestep, out, start, stop):
+    """
+    Euler integration of a compiled Lotka-Volterra model
+    :param x: List, Population before the first step
+    :param model: Compiled model from _compile_lotka_volterra
+    :param timestep: Timestep of the euler method of integration
+    :param out: Array(steps, species) the populations are written to
+    :param start: First row to integrate
+    :param stop: Row after the last row to integrate
+    :return: List, Population after the last step
+    """
+    prey_terms = model["prey_terms"]
+    pred_terms = model["pred_terms"]
+    species = len(x)
+    for i in range(start, stop):
+        pop_update = [0.] * species
+        # pyi = prey_i
+        # pdi = predator_i
+        for pyi, a_, bs_ in prey_terms:
+            # birth rate
+            current_prey = a_ * x[pyi]
+            for b_, pdi in bs_:
+                # predation
+                current_prey -= b_ * x[pyi] * x[pdi]
+            pop_update[pyi] = current_prey * timestep
+        for pdi, c_, ds_ in pred_terms:
+            # predator death rate
+            current_pred = -(c_ * x[pdi])
+            for d_, pyi in ds_:
+                # predation birth rate
+                current_pred += d_ * x[pyi] * x[pdi]
+            pop_update[pdi] += current_pred * timestep
+        x = [0. if n_pop < 0 else n_pop for n_pop in map(add, x, pop_update)]
+        out[i] = x
+    return x
+
+
+def _next_anomaly_trigger(start, stop, rand_th, legacy_rng=True, block=2 ** 16):
+    """
+    Find the next step an anomaly is triggered in
+    :param start: First step an anomaly is allowed to be triggered in
+    :param stop: Step after the last step of the sequence
+    :param rand_th: Factor when to enable random permutations in the population
+    :param legacy_rng: Consume the random stream exactly like a per step np.random.random() >= rand_th check
+    :param block: Number of per step draws generated at once in the legacy mode
+    :return: Step of the next trigger or None if no anomaly is triggered before stop
+    """
+    if not legacy_rng:
+        # geometric waiting time until the next per step check succeeds
+        if rand_th >= 1:
+            return None
+        trigger = start + np.random.geometric(min(1 - rand_th, 1.)) - 1
+        return int(trigger) if trigger < stop else None
+
+    i = start
+    while i < stop:
+        size = min(block, stop - i)
+        state = np.random.get_state()
+        hits = np.flatnonzero(np.random.random(size) >= rand_th)
+        if hits.size > 0:
+            # rewind and only consume the draws up to the trigger
+            np.random.set_state(state)
+            np.random.random(hits[0] + 1)
+            return i + int(hits[0])
+        i += size
+    return None
+
+
 def predator_prey(a=None, b=None, c=None, d=None, pop=None, names=None,
                   rand_th=None, anomaly=None, cooldown=None, periods=10, timestep=0.001,
-                  plot=False):
+                  legacy_rng=True, sink=None, chunk_rows=2 ** 16, plot=False):
     """
     Multivariate Predator Prey Generator
     :param a: List, alpha, The rate at which prey birth exceeds natural death
@@ -53,6 +142,11 @@ def predator_prey(a=None, b=None, c=None, d=None, pop=None, names=None,
     :param cooldown: Number of steps until a new anomaly is allowed to occur
     :param periods: The number of periods
     :param timestep: Timestep determines the accuracy of the euler method of integration
+    :param legacy_rng: Draw the anomaly triggers in the original per step order to regenerate the published sequences,
+                       otherwise jump to the next trigger with a geometric waiting time
+    :param sink: Callable the sequence is handed to in DataFrames of chunk_rows rows while it is generated,
+                 the returned DataFrame is None then and only one chunk is kept in memory
+    :param chunk_rows: Number of rows per chunk handed to the sink
     :return:
     """
     if a is None:
@@ -69,126 +163,130 @@ def predator_prey(a=None, b=None, c=None, d=None, pop=None, names=None,
     if names is None:
         names = ["Rabbits", "Foxes"]
 
-    pop_init = copy.deepcopy(pop)
+    species = len(pop)
+    model = _compile_lotka_volterra(a, b, c, d)
 
-    is_anomaly = [0]
-    random_permutations = [[False] for _ in range(len(pop))]
-    random_permutation_change = [0.]
+    # time vector from 1 to periods, seperated by a timestep, with the values and length of np.arange
+    total_steps = int(np.ceil((periods - 1) / timestep))
+    time_delta = (1 + timestep) - 1
+    no_anomaly_until = total_steps // 10
+    if sink is None:
+        chunk_rows = total_steps
+
+    feature_columns = [f"value-{i}" for i in range(species)]
+    permutation_columns = [f"permutation {names[i]}".replace(" ", "_") for i in range(species)]
+    # rows [window_start, window_stop) of the sequence, handed to the sink when the window is full
+    window = {"start": 0, "stop": min(chunk_rows, total_steps), "indexes": []}
+    population = np.empty((window["stop"], species))
+    is_anomaly = np.zeros(window["stop"], dtype=np.int64)
+    random_permutations = np.zeros((window["stop"], species), dtype=bool)
+    random_permutation_change = np.zeros(window["stop"])
     random_permutation_indexes = []
-    permutation = None
-    no_permutation_lock_down = None
+    chunks = []
+
+    def flush():
+        rows = window["stop"] - window["start"]
+        data_dict = {"timestamp": 1 + np.arange(window["start"], window["stop"]) * time_delta}
+        for i in range(species):
+            data_dict[feature_columns[i]] = population[:rows, i].copy()
+        for i in range(species):
+            data_dict[permutation_columns[i]] = random_permutations[:rows, i].copy()
+        data_dict["permutation_value"] = random_permutation_change[:rows].copy()
+        data_dict["is_anomaly"] = is_anomaly[:rows].copy()
+        if len(window["indexes"]) > 0:
+            # injected steps are flagged with True in the published sequences
+            data_dict["is_anomaly"] = data_dict["is_anomaly"].astype(object)
+            data_dict["is_anomaly"][np.array(window["indexes"]) - window["start"]] = True
+        if sink is None:
+            chunks.append(pd.DataFrame(data_dict))
+        else:
+            sink(pd.DataFrame(data_dict))
+        window["start"] = window["stop"]
+        window["stop"] = min(window["start"] + chunk_rows, total_steps)
+        window["indexes"] = []
+        is_anomaly[:] = 0
+        random_permutations[:] = False
+        random_permutation_change[:] = 0
+
+    def integrate(x, start, stop):
+        while start < stop:
+            if start == window["stop"]:
+                flush()
+            end = min(stop, window["stop"])
+            x = _lotka_volterra_steps(x, model, timestep, population, start - window["start"],
+                                      end - window["start"])
+            start = end
+        return x
+
+    population[0] = [p[-1] for p in pop]
+    x = population[0].tolist()
+    # first step a trigger is drawn for
+    next_check = no_anomaly_until + 1
+    i = 1
+    while i < total_steps:
+        trigger = None
+        if anomaly and rand_th is not None:
+            trigger = _next_anomaly_trigger(max(i, next_check), total_steps, rand_th, legacy_rng)
+        if trigger is None:
+            # plain ODE until the end of the sequence
+            x = integrate(x, i, total_steps)
+            break
+        # plain ODE up to and including the step the anomaly is triggered in
+        x = integrate(x, i, trigger + 1)
+        i = trigger + 1
+
+        # determine the direction of the anomaly
+        permutation_direction = 1 if np.random.random() >= 0.5 else -1
+        # determine which population to inject an anomaly
+        pop_select = np.random.randint(0, species)
+        # determine the length of the anomaly
+        permutation_steps = np.random.randint(20, 30)
+        # determine the magnitude of the anomaly
+        permutation_amount = np.random.randint(4, 7) * 0.02
+        permutation_amount *= permutation_direction
+        # determine a factor to soften the anomaly impact over time
+        permutation_reduction = np.random.randint(2, 5) * 0.001
+        permutation_reduction *= permutation_direction
+        original_amount = permutation_amount
 
-    # creates a time vector from 0 to end_time, seperated by a timestep
-    t = np.arange(1, periods, timestep)
-    total_steps = t.shape[0]
-    no_anomaly_until = total_steps // 10
-    for i in range(1, t.shape[0]):
-        pop_update = np.zeros(len(pop))
-        # update preys
-        # pyi = prey_i
-        # pdi = predator_i
-        for pyi, a_ in enumerate(a):
-            if a_ is not None:
-                # birth rate
-                current_prey = a_ * pop[pyi][-1]
-                for pdi, bs_ in enumerate(b):
-                    if bs_ is not None and bs_[pyi] is not None:
-                        # predation
-                        current_prey -= bs_[pyi] * pop[pyi][-1] * pop[pdi][-1]
-                pop_update[pyi] = current_prey * timestep
-        # update predators
-        for pdi, c_ in enumerate(c):
-            if c_ is not None:
-                # predator death rate
-                current_pred = -(c_ * pop[pdi][-1])
-                for pyi, ds_ in enumerate(d[pdi]):
-                    if ds_ is not None:
-                        # predation birth rate
-                        current_pred += ds_ * pop[pyi][-1] * pop[pdi][-1]
-                pop_update[pdi] += current_pred * timestep
-
-        for j in range(len(pop)):
-            n_pop = pop[j][-1] + pop_update[j]
-            if n_pop < 0:
-                n_pop = 0
-            pop[j].append(n_pop)
-
-        # track permutations
-        for j in range(len(pop)):
-            random_permutations[j].append(False)
-        is_anomaly.append(0)
-        random_permutation_change.append(0.)
         # execute permutations
-        if permutation is not None:
+        while i < total_steps:
+            x = integrate(x, i, i + 1)
+            row = i - window["start"]
             # track injected anomaly
-            random_permutations[permutation["pop"]][-1] = True
-            is_anomaly[-1] = True
-            random_permutation_change[-1] = permutation["amount"]
+            random_permutations[row, pop_select] = True
+            is_anomaly[row] = 1
+            random_permutation_change[row] = permutation_amount
             random_permutation_indexes.append(i)
+            window["indexes"].append(i)
             # apply anomaly
-            temp_population = pop[permutation["pop"]][-1]
-            pop[permutation["pop"]][-1] += permutation["amount"]
+            temp_population = x[pop_select]
+            x[pop_select] += permutation_amount
             # do control softening of the anomaly
-            temp_amount = permutation["amount"]
-            permutation["amount"] -= permutation["reduction"]
+            temp_amount = permutation_amount
+            permutation_amount -= permutation_reduction
             if plot:
-                print(i, "|", permutation["pop"], "|", "Pop.:", temp_population, ">", pop[permutation["pop"]][-1], "|",
-                      "Perm.:", temp_amount, ">", permutation["amount"], "=", permutation["reduction"])
-            permutation["steps"] -= 1
+                print(i, "|", pop_select, "|", "Pop.:", temp_population, ">", x[pop_select], "|",
+                      "Perm.:", temp_amount, ">", permutation_amount, "=", permutation_reduction)
+            permutation_steps -= 1
             # stop adding an anomaly if the population died
-            if pop[permutation["pop"]][-1] < 0:
-                pop[permutation["pop"]][-1] = 0
-                permutation["steps"] = 0
-
-            if permutation["steps"] <= 0 or \
-                    np.abs(np.diff([permutation["amount"], permutation["original_amount"]])[0]) >= \
-                    np.abs(permutation["original_amount"]):
-                permutation = None
-                no_permutation_lock_down = cooldown
-                continue
-
-        if anomaly and rand_th is not None and i > no_anomaly_until:
-            if permutation is None and no_permutation_lock_down is None and np.random.random() >= rand_th:
-                # determine the direction of the anomaly
-                permutation_direction = 1 if np.random.random() >= 0.5 else -1
-                # determine which population to inject an anomaly
-                pop_select = np.random.randint(0, len(pop))
-                # population died-out = continue
-                if pop[pop_select] == 0:
-                    continue
-                # determine the length of the anomaly
-                permutation_steps = np.random.randint(20, 30)
-                # determine the magnitude of the anomaly
-                permutation_amount = np.random.randint(4, 7) * 0.02
-                permutation_amount *= permutation_direction
-                # determine a factor to soften the anomaly impact over time
-                permutation_reduction = np.random.randint(2, 5) * 0.001
-                permutation_reduction *= permutation_direction
-
-                permutation = {
-                    "pop": pop_select,
-                    "steps": permutation_steps,
-                    "amount": permutation_amount,
-                    "reduction": permutation_reduction,
-                    "original_amount": permutation_amount
-                }
-        if no_permutation_lock_down is not None:
-            no_permutation_lock_down -= 1
-            if no_permutation_lock_down <= 0:
-                no_permutation_lock_down = None
-
-    feature_columns = []
-    data_dict = {}
-    data_dict["timestamp"] = t
-    for i, p in enumerate(pop):
-        data_dict[f"value-{i}"] = p
-        feature_columns.append(f"value-{i}")
-    for i, p in enumerate(random_permutations):
-        data_dict[f"permutation {names[i]}".replace(" ", "_")] = p
-    data_dict["permutation_value"] = random_permutation_change
-    data_dict["is_anomaly"] = is_anomaly
-
-    df = pd.DataFrame(data_dict)
+            if x[pop_select] < 0:
+                x[pop_select] = 0.
+                permutation_steps = 0
+            population[row] = x
+            i += 1
+            if permutation_steps <= 0 or \
+                    np.abs(original_amount - permutation_amount) >= np.abs(original_amount):
+                break
+
+        # the cooldown counts down from the step after the permutation ended
+        if cooldown is None:
+            next_check = i
+        else:
+            next_check = i + max(cooldown, 1)
+    flush()
+
+    df = chunks[0] if sink is None else None
 
     parameters = {
         "names": list(names),
@@ -200,21 +298,18 @@ def predator_prey(a=None, b=None, c=None, d=None, pop=None, names=None,
         "anomalies": [{"kinds": [{"kind": "nature"}]}]
     }
 
-    if plot:
+    if plot and df is not None:
         """ visualization """
         # visualization of deterministic populations against time
+        t = df["timestamp"].to_numpy()
+        population = df[feature_columns].to_numpy()
+        random_permutations = df[permutation_columns].to_numpy()
         plt.figure(figsize=(40, 20))
-        for p in pop:
-            plt.plot(t, p)
-        x_scatter = []
-        y_scatter = []
-        for i, row in enumerate(zip(*random_permutations)):
-            for j, col in enumerate(row):
-                if col:
-                    x_scatter.append(t[i])
-                    y_scatter.append(pop[j][i])
-
-        plt.scatter(x_scatter, y_scatter, c="black", alpha=0.3)
+        for i in range(species):
+            plt.plot(t, population[:, i])
+        rows, cols = np.nonzero(random_permutations)
+
+        plt.scatter(t[rows], population[rows, cols], c="black", alpha=0.3)
         plt.xlabel('Time')
         plt.ylabel('Population Size')
         plt.legend(names)
@@ -223,12 +318,12 @@ def predator_prey(a=None, b=None, c=None, d=None, pop=None, names=None,
         plt.tight_layout()
         plt.show()
 
-    return df, parameters, f"{len(pop)}-lotka_volterra"
+    return df, parameters, f"{species}-lotka_volterra"
 
 
 def generate_4_3_prey_2_predator_500_cooldown_1_mil_steps(rand_th=None, anomaly=True,
                                                           cooldown=500, periods=1000,
-                                                          plot=False):
+                                                          legacy_rng=True, sink=None, plot=False):
     if rand_th is None:
         rand_th = 0.99999
     df, parameters, group = predator_prey(a=(0.2, 0.2, 0., None),
@@ -248,15 +343,19 @@ def generate_4_3_prey_2_predator_500_cooldown_1_mil_steps(rand_th=None, anomaly=
                                           cooldown=cooldown,
                                           periods=periods,
                                           anomaly=anomaly,
+                                          legacy_rng=legacy_rng,
+                                          sink=sink,
                                           plot=plot)
     return df, parameters, f"{group}-3-prey-2-predator-500-cooldown-1-mil-steps"
 
 
-def generate_4_3_prey_2_predator_300_cooldown_short(rand_th=0.99998, anomaly=True, plot=False):
+def generate_4_3_prey_2_predator_300_cooldown_short(rand_th=0.99998, anomaly=True, legacy_rng=True, sink=None,
+                                                    plot=False):
     periods = 200
     cooldown = 300
     df, parameters, group = generate_4_3_prey_2_predator_500_cooldown_1_mil_steps(
-        rand_th=rand_th, anomaly=anomaly, cooldown=cooldown, periods=periods, plot=plot
+        rand_th=rand_th, anomaly=anomaly, cooldown=cooldown, periods=periods, legacy_rng=legacy_rng, sink=sink,
+        plot=plot
     )
 
     return df, parameters, group.replace("500", "300").replace("1-mil-steps", "short")
@@ -264,7 +363,7 @@ def generate_4_3_prey_2_predator_300_cooldown_short(rand_th=0.99998, anomaly=Tru
 
 def generate_4_2_prey_2_predator_1000_cooldown_1_mil_steps(rand_th=None, anomaly=True,
                                                            cooldown=1000, periods=1000,
-                                                           plot=False):
+                                                           legacy_rng=True, sink=None, plot=False):
     if rand_th is None:
         rand_th = 0.99999
     df, parameters, group = predator_prey(a=(0.3, 0.25, None, None),
@@ -284,20 +383,47 @@ def generate_4_2_prey_2_predator_1000_cooldown_1_mil_steps(rand_th=None, anomaly
                                           cooldown=cooldown,
                                           periods=periods,
                                           anomaly=anomaly,
+                                          legacy_rng=legacy_rng,
+                                          sink=sink,
                                           plot=plot)
     return df, parameters, f"{group}-2-prey-2-predator-1000-cooldown-1-mil-steps"
 
 
-def generate_4_2_prey_2_predator_300_cooldown_short(rand_th=0.99998, anomaly=True, plot=False):
+def generate_4_2_prey_2_predator_300_cooldown_short(rand_th=0.99998, anomaly=True, legacy_rng=True, sink=None,
+                                                    plot=False):
     periods = 200
     cooldown = 300
     df, parameters, group = generate_4_2_prey_2_predator_1000_cooldown_1_mil_steps(
-        rand_th=rand_th, anomaly=anomaly, cooldown=cooldown, periods=periods, plot=plot
+        rand_th=rand_th, anomaly=anomaly, cooldown=cooldown, periods=periods, legacy_rng=legacy_rng, sink=sink,
+        plot=plot
     )
 
     return df, parameters, group.replace("1000", "300").replace("1-mil-steps", "short")
 
 
+def _autoregressive(a, noise, reset=None, start=0):
+    """
+    Values of x_t = a * x_{t-1} + noise_t, rounded exactly like the step by step recursion
+    :param a: Factor of the previous value
+    :param noise: Array of the noise added per step along the last axis, leading axes are independent sequences
+    :param reset: Bool array of the steps the value is set to 0 and continues from, single sequences only
+    :param start: Value before the first step, per sequence or shared
+    :return: Array of the values
+    """
+    if reset is None or not reset.any():
+        zi = np.broadcast_to(np.multiply(a, start), np.shape(noise)[:-1])[..., None]
+        return lfilter([1.], [1., -a], noise, zi=zi)[0]
+    # one row per reset segment, all rows are filtered at once
+    segment = np.cumsum(reset)
+    starts = np.concatenate([[0], np.flatnonzero(reset)])
+    offset = np.arange(len(noise)) - starts[segment]
+    rows = np.zeros((len(starts), offset.max() + 1))
+    rows[segment, offset] = np.where(reset, 0., noise)
+    zi = np.zeros((len(starts), 1))
+    zi[0, 0] = a * start
+    return lfilter([1.], [1., -a], rows, axis=1, zi=zi)[0][segment, offset]
+
+
 def generate_simple_increasing_data(a_t=None, anomaly=True, plot=False):
     if a_t is None:
         a_t = [1, 0.99]
@@ -309,30 +435,17 @@ def generate_simple_increasing_data(a_t=None, anomaly=True, plot=False):
         "anomalies": [{"kinds": [{"kind": "signal-cancellation"}]}]
     }
 
-    def next_value(a_x, value):
-        return a_x * value + np.random.random()
-
-    data = [[0], [0], [0]]
-    t = [0]
-    for i in range(1, 1000):
-        t.append(i)
-        data[0].append(next_value(a_t[0], data[0][-1]))
-        data[1].append(next_value(a_t[1], data[1][-1]))
-        data[2].append(0)
+    t = np.arange(1100)
+    noise = np.random.random((999, 2))
+    data = [np.concatenate([[0], _autoregressive(a_t[j], noise[:, j])]) for j in [0, 1]]
+    is_anomaly = np.zeros(1100, dtype=np.int64)
     if anomaly:
-        data[-1][-1] = 1
-        a_0 = [0, 0]
-        for i in range(100):
-            t.append(1000 + i)
-            data[0].append(0)
-            data[1].append(0)
-            data[2].append(1)
+        is_anomaly[999:] = 1
+        data = [np.concatenate([d, np.zeros(100)]) for d in data]
     else:
-        for i in range(100):
-            t.append(1000 + i)
-            data[0].append(next_value(a_t[0], data[0][-1]))
-            data[1].append(next_value(a_t[1], data[1][-1]))
-            data[2].append(0)
+        noise = np.random.random((100, 2))
+        data = [np.concatenate([d, _autoregressive(a_t[j], noise[:, j], start=d[-1])]) for j, d in enumerate(data)]
+    data.append(is_anomaly)
 
     if plot:
         __simple_plot(t, data)
@@ -371,30 +484,21 @@ def generate_saw_data(a_t=None, cuts=None, iterations=None, inject=None, anomaly
         "anomalies": [{"kinds": [{"kind": "signal-reset"}]}]
     }
 
-    def next_value(a_x, value):
-        return a_x * value + np.random.random()
-
-    data = [[0] for _ in range(len(a_t) + 1)]
-    t = [0]
-    for i in range(1, iterations):
-        if i > anomaly_start:
-            current_cuts = cuts
-        t.append(i)
-        data[-1].append(0)
-        for j in range(len(a_t)):
-            if i % current_cuts[j] == 0:
-                if anomaly and i > anomaly_start:
-                    data[j].append(0)
-                    parameters["permutation"].append(i)
-                else:
-                    data[j].append(0)
-            else:
-                data[j].append(next_value(a_t[j], data[j][-1]))
+    t = np.arange(iterations)
+    steps = t[1:, None]
+    current_cuts = np.where(steps > anomaly_start, cuts, current_cuts)
+    reset = steps % current_cuts == 0
+    if anomaly:
+        parameters["permutation"] = (np.flatnonzero((reset & (steps > anomaly_start)).any(axis=1)) + 1).tolist()
+    # one draw per step and channel without reset, in the order of the step by step loop
+    noise = np.zeros(reset.shape)
+    noise[~reset] = np.random.random(np.count_nonzero(~reset))
 
-    parameters["permutation"] = sorted(list(set(parameters["permutation"])))
-    for p in parameters["permutation"]:
-        for i in range(p - 1, p + 2):
-            data[-1][i] = 1
+    data = [np.concatenate([[0], _autoregressive(a_t[j], noise[:, j], reset[:, j])]) for j in range(len(a_t))]
+    is_anomaly = np.zeros(iterations + 1, dtype=np.int64)
+    is_anomaly[(np.array(parameters["permutation"], dtype=np.int64)[:, None] + [-1, 0, 1]).ravel()] = 1
+    is_anomaly = is_anomaly[:iterations]
+    data.append(is_anomaly)
 
     if plot:
         __simple_plot(t, data)
@@ -730,7 +834,7 @@ def generate_long_no_synced_cut_wave_data(a_t=None, cuts=None, end=None, iterati
     return df, parameters, group.replace("no", "no-long")
 
 
-def generate_std_cut_increasing_data(a_t=None, b_t=None, std_past=None, std_ratio=None, anomaly=True, plot=False):
+def _std_cut_increasing_parameters(a_t=None, b_t=None, std_past=None, std_ratio=None, anomaly=True):
     if a_t is None:
         a_t = [1, 0.99]
     if b_t is None:
@@ -748,33 +852,42 @@ def generate_std_cut_increasing_data(a_t=None, b_t=None, std_past=None, std_rati
         "channels": 2,
         "anomalies": [{"kinds": [{"kind": "signal-cut"}]}]
     }
+    return a_t, b_t, std_past, std_ratio, parameters
 
-    def next_value(a_x, value):
-        return a_x * value + np.random.random()
 
-    data = [[0], [0], [0]]
-    t = [0]
-    for i in range(1, 1000):
-        t.append(i)
-        data[-1].append(0)
-        for j in [0, 1]:
-            data[j].append(next_value(a_t[j], data[j][-1]))
+def _std_cut_increasing_values(a_t, b_t, std_past, std_ratio, anomaly, noise):
+    """
+    Values of stacked std cut increasing sequences that share a_t and b_t
+    :param std_past: Per sequence the list of past values per channel the std of the cut is computed from
+    :param std_ratio: Per sequence the list of factors of the std per channel
+    :param noise: Array(variants, steps, channels) of the noise in draw order, 1098 steps with anomaly else 1099
+    :return: Array(variants, time, channels) of the values
+    """
+    variants = noise.shape[0]
+    # time as last axis, the filter and the std run over contiguous rows
+    values = np.zeros((variants, 2, 1100))
+    for j in [0, 1]:
+        values[:, j, 1:1000] = _autoregressive(a_t[j], noise[:, :999, j])
+        if anomaly:
+            for v in range(variants):
+                values[v, j, 1000] = values[v, j, 999] - (np.std(values[v, j, :1000][-std_past[v][j]:]) *
+                                                          std_ratio[v][j])
+        else:
+            values[:, j, 1000] = _autoregressive(a_t[j], noise[:, 999:1000, j], start=values[:, j, 999])[:, 0]
+        values[:, j, 1001:] = _autoregressive(b_t[j], noise[:, -99:, j], start=values[:, j, 1000])
+    return values.transpose(0, 2, 1)
 
-    t.append(1000)
-    if anomaly:
-        data[-1].append(1)
-        for j in [0, 1]:
-            data[j].append(data[j][-1] - (np.std(data[j][-std_past[j]:]) * std_ratio[j]))
-    else:
-        data[-1].append(0)
-        for j in [0, 1]:
-            data[j].append(next_value(a_t[j], data[j][-1]))
 
-    for i in range(99):
-        t.append(1001 + i)
-        data[-1].append(0)
-        for j in [0, 1]:
-            data[j].append(next_value(b_t[j], data[j][-1]))
+def generate_std_cut_increasing_data(a_t=None, b_t=None, std_past=None, std_ratio=None, anomaly=True, plot=False):
+    a_t, b_t, std_past, std_ratio, parameters = _std_cut_increasing_parameters(a_t, b_t, std_past, std_ratio, anomaly)
+
+    t = np.arange(1100)
+    noise = np.random.random((1, 1098 if anomaly else 1099, 2))
+    values = _std_cut_increasing_values(a_t, b_t, [std_past], [std_ratio], anomaly, noise)[0]
+    is_anomaly = np.zeros(1100, dtype=np.int64)
+    if anomaly:
+        is_anomaly[1000] = 1
+    data = [values[:, 0], values[:, 1], is_anomaly]
 
     if plot:
         __simple_plot(t, data)
@@ -784,6 +897,40 @@ def generate_std_cut_increasing_data(a_t=None, b_t=None, std_past=None, std_rati
                          "is_anomaly": data[-1]}), parameters, "2-std_cut_increasing"
 
 
+def generate_std_cut_increasing_batch(points, seeds, anomaly=True):
+    """
+    Generate several parameter points of generate_std_cut_increasing_data at once
+    Points that share a_t and b_t are computed as one stacked (variants, time, channels) array, the noise of each
+    point is drawn after seeding the global random stream with its seed.
+    :param points: List of keyword arguments of generate_std_cut_increasing_data per point
+    :param seeds: Seed per point
+    :param anomaly: Include anomalies or not
+    :return: List of (df, parameters, group) per point, the same as generate_std_cut_increasing_data with its seed
+    """
+    resolved = [_std_cut_increasing_parameters(**point, anomaly=anomaly) for point in points]
+    batches = {}
+    for k, (a_t, b_t, _, _, _) in enumerate(resolved):
+        batches.setdefault((tuple(a_t), tuple(b_t)), []).append(k)
+
+    results = [None] * len(points)
+    t = np.arange(1100)
+    is_anomaly = np.zeros(1100, dtype=np.int64)
+    if anomaly:
+        is_anomaly[1000] = 1
+    for (a_t, b_t), members in batches.items():
+        noise = []
+        for k in members:
+            np.random.seed(seeds[k])
+            noise.append(np.random.random((1098 if anomaly else 1099, 2)))
+        values = _std_cut_increasing_values(a_t, b_t, [resolved[k][2] for k in members],
+                                            [resolved[k][3] for k in members], anomaly, np.stack(noise))
+        for v, k in enumerate(members):
+            results[k] = (pd.DataFrame({"timestamp": t,
+                                        "value-0": values[v, :, 0], "value-1": values[v, :, 1],
+                                        "is_anomaly": is_anomaly.copy()}), resolved[k][4], "2-std_cut_increasing")
+    return results
+
+
 def generate_std_cut_increasing_data_dynamic(pre_std_ratio, pre_std_past):
     def _gen(a_t=None, b_t=None, std_past=None, std_ratio=None, anomaly=True, plot=False):
         if pre_std_ratio is None:
@@ -818,6 +965,72 @@ def generate_std_cut_continue_increasing_data_dynamic(pre_std_ratio, pre_std_pas
     return _gen
 
 
+def _accumulate_time(start, step, n):
+    """
+    Times of n steps that are added one after the other, the same rounding as repeated t += step
+    """
+    times = np.full(n, step)
+    times[0] = start
+    return np.add.accumulate(times)
+
+
+def _std_cut_wave_channel(a_, cut, std_past, std_ratio, start, t_diff, iterations, anomaly, permutation,
+                          block=2 ** 8):
+    """
+    One channel of the std cut wave, the sine segments between two cuts are evaluated as arrays
+    :param a_: Frequency of the sine wave
+    :param cut: Period of the cuts in time units
+    :param std_past: Number of past values the std of a cut is computed from
+    :param std_ratio: Factor of the std the jump at a cut has to exceed
+    :param start: Time of the first value
+    :param t_diff: Time between two values
+    :param iterations: Number of values
+    :param anomaly: Include cuts or not
+    :param permutation: List the indexes of the cuts are appended to
+    :param block: Number of values evaluated at once after a cut, doubled until the next cut
+    :return: Array of the values
+    """
+    def next_sequence(a, t, noise=1):
+        return np.sin(a * t) + noise * np.random.random() * 0.03
+
+    t_diff_half = t_diff / 2
+    values = np.empty(iterations)
+    t_ = start
+    i = 0
+    size = block
+    while i < iterations:
+        n = min(size, iterations - i)
+        # times until the end of the block if no cut occurs
+        times = _accumulate_time(t_, t_diff, n)
+        stop = n
+        if anomaly:
+            hits = np.flatnonzero((times > 1) & (times % cut < 0.01))
+            if len(hits) > 0:
+                stop = int(hits[0])
+        # one draw per value in the order of the scalar loop
+        values[i:i + stop] = np.sin(a_ * times[:stop]) + np.random.random(stop) * 0.03
+        i += stop
+        if stop == n:
+            t_ = times[-1] + t_diff
+            size *= 2
+            continue
+        size = block
+
+        # permutation, move along the wave until the jump exceeds the std of the past values
+        t_ = times[stop]
+        permutation.append(i)
+        last = values[i - 1]
+        std = np.std(values[:i][-std_past:]) * std_ratio
+        x = last
+        while np.abs(x - last) <= std:
+            t_ += t_diff_half
+            x = next_sequence(a_, t_, noise=0)
+        values[i] = x
+        t_ += t_diff
+        i += 1
+    return values
+
+
 def generate_std_cut_wave_data(a_t=None, cuts=None, std_past=None, std_ratio=None, end=None, iterations=None,
                                anomaly=True, plot=False):
     if a_t is None:
@@ -845,42 +1058,19 @@ def generate_std_cut_wave_data(a_t=None, cuts=None, std_past=None, std_ratio=Non
         "anomalies": [{"kinds": [{"kind": "signal-cut-match"}]}]
     }
 
-    def next_sequence(a, t, noise=1):
-        return np.sin(a * t) + noise * np.random.random() * 0.03
-
-    data = [[] for _ in range(len(a_t) + 1)]
+    data = []
     ts = np.linspace(0, end, iterations)
     t_diff = np.mean(np.diff(ts))
-    t_diff_half = t_diff / 2
 
     for j in range(len(a_t)):
-        cut = cuts[j]
-        a_ = a_t[j]
-        t_ = None
-        for i, t in enumerate(ts):
-            if t_ is None:
-                t_ = t
-            if anomaly and t_ > 1 and t_ % cut < 0.01:
-                # permutation
-                parameters["permutation"].append(i)
-                last = data[j][-1]
-                std = np.std(data[j][-std_past[j]:]) * std_ratio[j]
-                # x = last + x_ if last <= 0 else last - x_
-                x = last
-                while np.abs(np.diff([last, x]))[0] <= std:
-                    t_ += t_diff_half
-                    x = next_sequence(a_, t_, noise=0)
-            else:
-                x = next_sequence(a_, t_)
-            data[j].append(x)
-            t_ += t_diff
+        data.append(_std_cut_wave_channel(a_t[j], cuts[j], std_past[j], std_ratio[j], ts[0], t_diff, iterations,
+                                          anomaly, parameters["permutation"]))
 
     parameters["permutation"] = sorted(list(set(parameters["permutation"])))
-    data[-1].extend([0] * len(data[0]))
+    is_anomaly = np.zeros(iterations, dtype=np.int64)
     for p in parameters["permutation"]:
-        for i in range(p - 1, p + 1 + 1):
-            if i < iterations:
-                data[-1][i] = 1
+        is_anomaly[p - 1:p + 2] = 1
+    data.append(is_anomaly)
 
     if plot:
         __simple_plot(ts, data)
@@ -1058,23 +1248,31 @@ def generate_correlation_data(alpha=None, cut=None, trend=None, iterations=None,
     is_anomaly = np.full(iterations, 0)
 
     g = ig.Graph.Adjacency(graph_matrix)
-    tree_graph = g.degree(mode="in")
-
-    if 0 not in tree_graph:
+    if 0 not in g.degree(mode="in"):
         raise ValueError("No independent channel available")
-    for node_value in sorted(set(tree_graph)):
-        if node_value == 0:
-            continue
-        for i in range(iterations):
-            for n in np.where(np.array(tree_graph) == node_value)[0]:
-                if cut[n] is None or i < cut[n][0] or cut[n][1] < i:
-                    v = 0
-                    for ai, a in enumerate(alpha_t[n, :]):
-                        v += a * r[i, ai] + (1 - a) * r[i, n]
-                    v /= alpha_t.shape[0]
-                    r[i, n] = v
-                else:
-                    is_anomaly[i] = 1
+    if not g.is_dag():
+        raise ValueError("Channels influence each other in a cycle")
+    # layer of a channel is the longest path from an independent channel
+    layers = np.zeros(len(alpha), dtype=int)
+    for n in g.topological_sorting(mode="out"):
+        for p in g.predecessors(n):
+            layers[n] = max(layers[n], layers[p] + 1)
+
+    steps = np.arange(iterations)
+    for layer in range(1, layers.max() + 1):
+        nodes = np.flatnonzero(layers == layer)
+        # the terms are summed channel by channel like the scalar update, a matrix product would round differently
+        v = np.zeros((iterations, len(nodes)))
+        for ai in range(alpha_t.shape[0]):
+            a = alpha_t[nodes, ai]
+            v += a * r[:, [ai]] + (1 - a) * r[:, nodes]
+        v /= alpha_t.shape[0]
+        for k, n in enumerate(nodes):
+            keep = np.ones(iterations, dtype=bool)
+            if cut[n] is not None:
+                keep = (steps < cut[n][0]) | (cut[n][1] < steps)
+            r[keep, n] = v[keep, k]
+            is_anomaly[~keep] = 1
 
     data = {"timestamp": list(range(iterations))}
     for i in range(alpha_t.shape[0]):
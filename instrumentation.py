@@ -0,0 +1,121 @@
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# registered hooks, every record is passed to each of them, nothing is measured while it is empty
+_hooks = []
+# measure the peak memory of the blocks that request it
+_trace_memory = False
+# tracemalloc was started by add_hook and is stopped with the last hook
+_started_tracing = False
+
+
+class JsonLinesHook:
+    """
+    Append each record as one JSON line to a file
+    Every record is a single append, several processes and threads can write to the same file.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def __call__(self, record: dict):
+        line = json.dumps(record, default=str) + "\n"
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line)
+
+
+def add_hook(hook, memory: bool = False):
+    """
+    Enable the instrumentation and pass all following records to a hook
+    :param hook: Callable that gets each record as dict with the keys event, time, pid and the measured fields,
+                 e.g. a JsonLinesHook or list.append
+    :param memory: Measure the peak memory of the generation with tracemalloc, slows down the generators
+    """
+    global _trace_memory, _started_tracing
+    _hooks.append(hook)
+    if memory:
+        _trace_memory = True
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _started_tracing = True
+
+
+def remove_hook(hook):
+    """
+    Stop passing records to a hook, the instrumentation is disabled with the last hook
+    """
+    global _trace_memory, _started_tracing
+    _hooks.remove(hook)
+    if len(_hooks) == 0:
+        _trace_memory = False
+        if _started_tracing:
+            tracemalloc.stop()
+            _started_tracing = False
+
+
+def init_worker(hook, memory: bool = False):
+    """
+    Register a hook in a worker process as its only one, initializer of a process pool
+    Workers started with fork inherit the hooks of the parent, they would receive every record twice.
+    """
+    global _trace_memory
+    _hooks.clear()
+    _trace_memory = False
+    add_hook(hook, memory)
+
+
+@contextmanager
+def instrument(hook, memory: bool = False):
+    """
+    Pass the records of a block to a hook, see add_hook
+    """
+    add_hook(hook, memory)
+    try:
+        yield hook
+    finally:
+        remove_hook(hook)
+
+
+def enabled():
+    return len(_hooks) > 0
+
+
+def emit(event: str, **fields):
+    """
+    Pass a record to all hooks, without hooks nothing is done
+    :param event: Kind of the record, e.g. generate, write, read or evict
+    :param fields: Measured values and identifiers of the record
+    """
+    if len(_hooks) == 0:
+        return
+    record = {"event": event, "time": time.time(), "pid": os.getpid(), **fields}
+    for hook in list(_hooks):
+        hook(record)
+
+
+@contextmanager
+def measure(event: str, memory: bool = False, **fields):
+    """
+    Emit the wall time of a block as one record, values the block adds to the yielded dict are included
+    Without hooks the block runs without measuring, blocks that raise are not recorded.
+    :param event: Kind of the record
+    :param memory: Add the peak of the memory allocated in the block as peak_bytes if enabled with add_hook,
+                   a memory block must not contain another one
+    :param fields: Identifiers of the record
+    """
+    if len(_hooks) == 0:
+        yield fields
+        return
+    trace = memory and _trace_memory and tracemalloc.is_tracing()
+    if trace:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    yield fields
+    fields["seconds"] = time.perf_counter() - start
+    if trace:
+        fields["peak_bytes"] = tracemalloc.get_traced_memory()[1] - base
+    emit(event, **fields)
@@ -1,16 +1,33 @@
-from pathlib import Path
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath, PureWindowsPath
 from shutil import rmtree
+from urllib.parse import quote
 
+import numpy as np
 import pandas as pd
-import yaml
 from requests import get
+from requests.exceptions import ChunkedEncodingError, ConnectionError as RequestsConnectionError, RequestException, \
+    Timeout
 import zipfile
 
+from instrumentation import emit, enabled, measure
+from storage import build_manifest, csv_file, default_permissions, file_mapping, file_sha256, labels_to_int8, \
+    load_configs, load_npz, manifest_entry, manifest_name, map_npz, permutation_prefix, read_csv, read_manifest, \
+    save_npz, verify_manifest, write_manifest
+
 default_benchmark_path = {"fsb": f"{Path(__file__).parent}/fsb_timeseries",
                           "srb": f"{Path(__file__).parent}/srb_timeseries"}
 base_url = "https://github.com/2er0/mTADS/releases/download/v1.0/"
 benchmark_file_name = {"fsb": "fsb_timeseries.zip",
                        "srb": "srb_timeseries.zip"}
+split_file_name = {"train": "train_anomaly",
+                   "train_no_anomaly": "train_no_anomaly",
+                   "test": "test"}
 
 
 def get_default_path(benchmark: str = "fsb"):
@@ -20,113 +37,731 @@ def get_default_path(benchmark: str = "fsb"):
         raise ValueError(f"Benchmark suite '{benchmark}' not available")
 
 
-def check_suite_availability(benchmark: str = "fsb"):
-    base_path = Path(get_default_path(benchmark))
-    if base_path.exists() and len(list(base_path.glob("*.yaml"))) > 0 and len(list(base_path.glob("*/*.csv"))) > 0:
-        # all good
-        print(f"Benchmark suite {benchmark} is available.")
-        return
+def download_file(url: str, target, sha256: str = None, chunk_size: int = 1024 ** 2, retries: int = 3):
+    """
+    Download a file to disk in chunks, interrupted transfers are resumed with HTTP range requests
+    The transfer is written to target.part first and only moved to target when it is complete and verified.
+    :param url: Address of the file
+    :param target: File to store it in
+    :param sha256: Expected SHA-256 hex digest of the file, not verified if None
+    :param chunk_size: Number of bytes written at once
+    :param retries: Number of times an interrupted transfer is resumed
+    :return: SHA-256 hex digest of the file
+    """
+    target = Path(target)
+    part = Path(f"{target}.part")
+    for attempt in range(retries + 1):
+        # continue the hash over the already transferred bytes
+        digest = hashlib.sha256()
+        offset = 0
+        if part.exists():
+            with open(part, "rb") as f:
+                for block in iter(lambda: f.read(chunk_size), b""):
+                    digest.update(block)
+                    offset += len(block)
+        try:
+            with get(url, stream=True, timeout=60,
+                     headers={"Range": f"bytes={offset}-"} if offset > 0 else {}) as r:
+                if r.status_code == 416:
+                    # the partial file is already complete
+                    break
+                r.raise_for_status()
+                if r.status_code != 206 and offset > 0:
+                    # the server ignored the range, start over
+                    digest = hashlib.sha256()
+                    offset = 0
+                with open(part, "ab" if offset > 0 else "wb") as f:
+                    for block in r.iter_content(chunk_size):
+                        f.write(block)
+                        digest.update(block)
+            break
+        except (RequestsConnectionError, ChunkedEncodingError, Timeout):
+            if attempt == retries:
+                raise
+            print(f"Download of {url} interrupted, resuming")
+    if sha256 is not None and digest.hexdigest() != sha256.lower():
+        part.unlink()
+        raise ValueError(f"Checksum of {url} does not match, expected {sha256} got {digest.hexdigest()}")
+    os.replace(part, target)
+    return digest.hexdigest()
 
-    # clean
-    download_dir = f"{Path(__file__).parent}/download/"
-    # clean previously downloaded
-    rmtree(f"{download_dir}{benchmark_file_name[benchmark]}", ignore_errors=True)
-    # clean benchmark folder
-    rmtree(default_benchmark_path[benchmark], ignore_errors=True)
 
-    # setup folders
-    Path(download_dir).mkdir(parents=True, exist_ok=True)
-    Path(default_benchmark_path[benchmark]).mkdir(parents=True, exist_ok=True)
+def published_sha256(url: str):
+    """
+    SHA-256 published next to a release asset as <asset>.sha256 in the sha256sum format, None if there is none
+    """
+    try:
+        r = get(f"{url}.sha256", timeout=60)
+    except RequestException:
+        return None
+    if r.status_code != 200 or len(r.text.split()) == 0:
+        return None
+    return r.text.split()[0]
+
+
+def extract_archive(archive, target, workers: int = 4, names=None):
+    """
+    Extract a zip archive with the members distributed over several threads, each with its own file handle
+    :param archive: Zip file
+    :param target: Folder to extract it to
+    :param workers: Number of threads
+    :param names: Only extract the files and folders with these names below the top folder of the archive, all if None
+    """
+    def _selected(m: zipfile.ZipInfo):
+        parts = m.filename.split("/")
+        return names is None or (len(parts) > 1 and parts[1] in names)
+
+    with zipfile.ZipFile(archive) as zip_ref:
+        members = [m for m in zip_ref.infolist() if not m.is_dir() and _selected(m)]
+        for m in zip_ref.infolist():
+            if m.is_dir() and _selected(m):
+                zip_ref.extract(m, target)
+
+    def _extract(part):
+        with zipfile.ZipFile(archive) as zip_ref:
+            for m in part:
+                zip_ref.extract(m, target)
+
+    # largest members first, spread evenly over the threads
+    members.sort(key=lambda m: m.file_size, reverse=True)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_extract, [members[i::workers] for i in range(workers)]))
 
-    # download
-    print(f"Downloading benchmark suite: {benchmark}")
-    r = get(f"{base_url}{benchmark_file_name[benchmark]}", stream=True)
+
+def _download_archive(benchmark: str, url: str = None, sha256: str = None):
+    """
+    Suite archive in the download folder, a partially downloaded archive is resumed
+    A complete archive of an earlier run is only reused if its checksum matches.
+    """
+    download_dir = f"{Path(__file__).parent}/download/"
+    Path(download_dir).mkdir(parents=True, exist_ok=True)
     suite_archive = f"{download_dir}{benchmark_file_name[benchmark]}"
-    with open(suite_archive, "wb") as f:
-        f.write(r.content)
+    if url is None:
+        url = f"{base_url}{benchmark_file_name[benchmark]}"
+    if sha256 is None:
+        sha256 = published_sha256(url)
+        if sha256 is None:
+            print(f"No checksum published for {url}, the download is not verified")
+
+    if Path(suite_archive).exists() and (sha256 is None or file_sha256(suite_archive) != sha256.lower()):
+        Path(suite_archive).unlink()
+    if not Path(suite_archive).exists():
+        print(f"Downloading benchmark suite: {benchmark}")
+        download_file(url, suite_archive, sha256)
+    return suite_archive
+
 
-    # unzip
+def _store_manifest(base_path: Path, manifest):
+    """
+    Store the manifest of a suite folder, a read-only folder keeps working with the manifest in memory
+    """
+    try:
+        write_manifest(base_path, manifest)
+    except OSError:
+        pass
+
+
+def check_suite_availability(benchmark: str = "fsb", url: str = None, sha256: str = None, workers: int = 4,
+                             verify: str = None, group_url: str = None, groups=None):
+    """
+    Download and extract a benchmark suite if it is not available yet
+    A suite is available when its manifest.json exists, which is written after a complete download or generation.
+    A suite folder with only some groups fetched with fetch_groups is completed from the published suite folder.
+    :param benchmark: Name of the benchmark suite: 'fsb' or 'srb'
+    :param url: Address of the suite archive, the release asset of base_url by default
+    :param sha256: Expected SHA-256 of the archive, by default the published <archive>.sha256 is used if there is one
+    :param workers: Number of threads extracting the archive
+    :param verify: Also check the files listed in the manifest: 'stat' compares sizes and modification times,
+                   'hash' the SHA-256 of every file. Missing or changed sequence groups are restored on their own
+    :param group_url: Address of a published suite folder to fetch the groups to restore from,
+                      else they are extracted from the suite archive
+    :param groups: Names of the groups that need to be available, all groups if None
+    """
+    base_path = Path(get_default_path(benchmark))
+    manifest = read_manifest(base_path)
+    if manifest is None and base_path.exists() and len(list(base_path.glob("*.yaml"))) > 0 and \
+            (len(list(base_path.glob("*/*.csv*"))) > 0 or len(list(base_path.glob("*/*.npz"))) > 0):
+        if not os.access(base_path, os.W_OK) and verify is None:
+            # read-only suite without manifest, e.g. shared between users, the index could not be kept
+            print(f"Benchmark suite {benchmark} is available.")
+            return
+        # suite without manifest, e.g. checked out with the repository, index it once
+        manifest = build_manifest(base_path)
+        _store_manifest(base_path, manifest)
+    if manifest is not None and "published" in manifest:
+        # only some groups were fetched, the others are fetched from where they came from
+        missing = sorted(set(manifest["published"] if groups is None else groups) - set(manifest["groups"]))
+        if len(missing) > 0:
+            print(f"Benchmark suite {benchmark} is partially available, fetching {len(missing)} sequence groups")
+            fetch_groups(benchmark, group_url or manifest["url"], missing)
+            manifest = read_manifest(base_path)
+    if manifest is not None:
+        broken = [] if verify is None else verify_manifest(base_path, manifest, verify)
+        if len(broken) == 0:
+            if verify is not None:
+                # keep the refreshed modification times
+                _store_manifest(base_path, manifest)
+            # all good
+            print(f"Benchmark suite {benchmark} is available.")
+            return
+        print(f"Restoring {len(broken)} missing or changed parts of {benchmark}: {broken}")
+        if group_url is not None:
+            fetch_groups(benchmark, group_url, [b for b in broken if b in manifest["groups"]])
+            return
+        staging = tempfile.mkdtemp(prefix=f".extract-{benchmark}-", dir=Path(__file__).parent)
+        try:
+            extract_archive(_download_archive(benchmark, url, sha256), staging, workers, broken)
+            for name in broken:
+                rmtree(base_path / name, ignore_errors=True)
+                if (base_path / name).is_file():
+                    (base_path / name).unlink()
+                if (Path(staging) / base_path.name / name).exists():
+                    os.replace(Path(staging) / base_path.name / name, base_path / name)
+        finally:
+            rmtree(staging, ignore_errors=True)
+        restored = build_manifest(base_path, broken)
+        manifest["files"].update(restored["files"])
+        manifest["groups"].update(restored["groups"])
+        _store_manifest(base_path, manifest)
+        return
+
+    suite_archive = _download_archive(benchmark, url, sha256)
+    # unzip next to the suite folder and replace it once complete
     print(f"Extracting {benchmark} suite")
-    with zipfile.ZipFile(suite_archive, 'r') as zip_ref:
-        zip_ref.extractall(f"{Path(__file__).parent}")
+    staging = tempfile.mkdtemp(prefix=f".extract-{benchmark}-", dir=Path(__file__).parent)
+    try:
+        extract_archive(suite_archive, staging, workers)
+        rmtree(base_path, ignore_errors=True)
+        os.replace(Path(staging) / base_path.name, base_path)
+    finally:
+        rmtree(staging, ignore_errors=True)
+    write_manifest(base_path)
+
+
+def _suite_path(base_path: Path, path: str) -> Path:
+    """
+    File of a suite folder named by a relative path of a remote manifest
+    Absolute paths, parent references and paths that leave the folder through a link are rejected.
+    """
+    if any(p.is_absolute() or p.drive or ".." in p.parts for p in (PurePosixPath(path), PureWindowsPath(path))):
+        raise ValueError(f"Path '{path}' of the manifest is outside of the suite folder")
+    target = base_path / path
+    if not target.resolve().is_relative_to(base_path.resolve()):
+        raise ValueError(f"Path '{path}' of the manifest is outside of the suite folder")
+    return target
+
+
+def fetch_groups(benchmark: str, url: str, groups=None, workers: int = 8):
+    """
+    Download only single sequence groups of a suite, listed in the manifest.json of a published suite folder
+    Files that are already present and intact are kept, every download is verified. The fetched files are added
+    to the manifest of the local suite folder, together with the published groups and the address, so that
+    check_suite_availability completes the suite when all groups are requested.
+    :param benchmark: Name of the benchmark suite: 'fsb' or 'srb'
+    :param url: Address of the published suite folder that contains the manifest.json, e.g. http://host/srb_timeseries/
+    :param groups: Names of the groups to download, all groups if None
+    :param workers: Number of files downloaded at once
+    :return: Names of the downloaded groups
+    """
+    base_path = Path(get_default_path(benchmark))
+    url = url.rstrip("/") + "/"
+    r = get(f"{url}{manifest_name}", timeout=60)
+    r.raise_for_status()
+    manifest = r.json()
+    if groups is None:
+        groups = list(manifest["groups"].keys())
+    missing = set(groups) - set(manifest["groups"].keys())
+    if len(missing) > 0:
+        raise ValueError(f"Sequence groups not published: {sorted(missing)}")
+
+    # the overview files hold the configurations of all groups
+    files = dict(manifest["files"])
+    for group in groups:
+        files.update(manifest["groups"][group])
+    # the manifest is remote input, every path is checked before anything is written
+    targets = {path: _suite_path(base_path, path) for path in files}
+    local = read_manifest(base_path) or {"files": {}, "groups": {}}
+    known = {**local["files"], **{path: entry for g in local["groups"].values() for path, entry in g.items()}}
+
+    def _fetch(item):
+        path, entry = item
+        target = targets[path]
+        if target.is_file() and target.stat().st_size == entry["size"]:
+            # unchanged since it was listed in the local manifest, else compare the content
+            listed = known.get(path, {})
+            if (listed.get("sha256") == entry["sha256"] and listed.get("mtime_ns") == target.stat().st_mtime_ns) \
+                    or file_sha256(target) == entry["sha256"]:
+                return
+        target.parent.mkdir(parents=True, exist_ok=True)
+        download_file(f"{url}{quote(path)}", target, entry["sha256"])
+
+    print(f"Fetching {len(groups)} sequence groups of {benchmark}")
+    base_path.mkdir(parents=True, exist_ok=True)
+    # largest files first, the small ones fill the gaps
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(_fetch, sorted(files.items(), key=lambda item: item[1]["size"], reverse=True)))
+
+    # the published hashes were verified, only size and modification time are read again
+    local["files"].update({name: manifest_entry(targets[name], entry["sha256"])
+                           for name, entry in manifest["files"].items()})
+    for group in groups:
+        local["groups"][group] = {path: manifest_entry(targets[path], entry["sha256"])
+                                  for path, entry in manifest["groups"][group].items()}
+    local["published"] = sorted(set(local.get("published", [])) | set(manifest["groups"]))
+    local["url"] = url
+    write_manifest(base_path, local)
+    return groups
+
+
+def sequence_size(sequence):
+    """
+    Memory held by a loaded sequence in bytes, memory-mapped arrays count with their mapped size,
+    their pages are loaded into memory on access
+    """
+    if sequence is None:
+        return 0
+    if isinstance(sequence, pd.DataFrame):
+        return int(sequence.memory_usage(deep=True).sum())
+    if isinstance(sequence, dict):
+        return sum(sequence_size(v) for v in sequence.values())
+    if isinstance(sequence, np.ndarray):
+        return sequence.nbytes
+    return 0
+
+
+def mapped_files(sequence):
+    """
+    Mappings of the files a loaded sequence is a view on, each holds a file descriptor
+    :return: Dict of mapping id to mapping
+    """
+    if isinstance(sequence, dict):
+        return {k: m for v in sequence.values() for k, m in mapped_files(v).items()}
+    mapping = file_mapping(sequence) if isinstance(sequence, np.ndarray) else None
+    return {} if mapping is None else {id(mapping): mapping}
+
+
+class DatasetCache:
+    """
+    Least recently used cache of loaded sequence groups limited by their memory usage and mapped files
+    Share one instance between several load_all_stored_datasets calls to reuse the loaded groups, it is thread-safe.
+    """
+
+    def __init__(self, max_bytes: int = 1024 ** 3, max_files: int = 128):
+        """
+        :param max_bytes: Memory budget of all cached groups, a group larger than the budget is not cached
+        :param max_files: Number of memory-mapped files the cached groups may keep open, below the file limit of
+                          the process, e.g. 256 on macOS
+        """
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.size = 0
+        self.files = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
 
+    def get(self, key):
+        """
+        :return: Cached value or None, a hit marks the entry as most recently used
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
 
-def load_all_stored_datasets(benchmark: str = "fsb"):
+    def put(self, key, value):
+        """
+        Cache a value and evict the least recently used entries until it fits into the budget
+        """
+        size = sequence_size(value)
+        files = len(mapped_files(value))
+        with self._lock:
+            if key in self._entries:
+                _, old_size, old_files = self._entries.pop(key)
+                self.size -= old_size
+                self.files -= old_files
+            if size > self.max_bytes or files > self.max_files:
+                return
+            evicted = []
+            while self._entries and (self.size + size > self.max_bytes or self.files + files > self.max_files):
+                evicted_key, (_, evicted_size, evicted_files) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.files -= evicted_files
+                self.evictions += 1
+                evicted.append((evicted_key, evicted_size))
+            self._entries[key] = (value, size, files)
+            self.size += size
+            self.files += files
+        for evicted_key, evicted_size in evicted:
+            emit("evict", key=evicted_key, bytes=evicted_size, for_key=key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self.files = 0
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self.size, "max_bytes": self.max_bytes,
+                "files": self.files, "max_files": self.max_files,
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+def get_cached_npz(csv_path, cache_dir, content_hash: bool = False) -> Path:
+    """
+    Binary copy of a CSV stored sequence in a persistent cache directory, created on first use
+    The copy is keyed by path, size and modification time of the CSV file, so regenerated sequences are parsed again.
+    Several processes can fill the same cache directory at once.
+    :param csv_path: CSV file of the sequence
+    :param cache_dir: Persistent cache directory
+    :param content_hash: Additionally key by the SHA-256 of the file content
+    :return: Path of the binary copy
+    """
+    csv_path = Path(csv_path).absolute()
+    cache_dir = Path(cache_dir).expanduser()
+    stat = csv_path.stat()
+    version = f"{stat.st_size}|{stat.st_mtime_ns}"
+    if content_hash:
+        version += f"|{file_sha256(csv_path)}"
+    prefix = hashlib.sha256(str(csv_path).encode()).hexdigest()[:32]
+    target = cache_dir / f"{prefix}-{hashlib.sha256(version.encode()).hexdigest()[:32]}.npz"
+    if target.exists():
+        return target
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    fd, temp = tempfile.mkstemp(prefix=".", suffix=".npz", dir=cache_dir)
+    os.close(fd)
+    try:
+        with measure("convert", path=str(csv_path), bytes=stat.st_size):
+            save_npz(pd.read_csv(csv_path), temp)
+        default_permissions(temp)
+        # atomic, concurrent writers of the same entry store identical content
+        os.replace(temp, target)
+    finally:
+        if Path(temp).exists():
+            Path(temp).unlink()
+    # remove outdated copies of the same file
+    for outdated in cache_dir.glob(f"{prefix}-*.npz"):
+        if outdated != target:
+            try:
+                outdated.unlink()
+            except OSError:
+                pass
+    return target
+
+
+def _sequence_length(path: Path, config):
+    """
+    Number of rows of the test sequence of a group, from its configuration or the header of a binary file
+    """
+    if "length" in config:
+        return config["length"]
+    if "iterations" in config:
+        return config["iterations"]
+    if "periods" in config and "timestep" in config:
+        return len(np.arange(1, config["periods"], config["timestep"]))
+    if Path(f"{path}/test.npz").exists():
+        return map_npz(Path(f"{path}/test.npz"))["timestamp"].shape[0]
+    return None
+
+
+def load_all_stored_datasets(benchmark: str = "fsb", mmap: bool = False, cache: DatasetCache = None,
+                             cache_dir: str = None, content_hash: bool = False, prefetch: int = 0, workers: int = 1,
+                             groups=None, compact: bool = False, value_dtype: str = "float64", url: str = None,
+                             verify: str = None):
+    """
+    Iterate over all sequences of a benchmark suite
+    :param benchmark: Name of the benchmark suite: 'fsb' or 'srb'
+    :param mmap: Yield read-only memory-mapped views on the binary files instead of DataFrames,
+                 each sequence is a dict with timestamp, columns, values(rows, channels) and is_anomaly
+    :param cache: Cache of the loaded groups, share it between calls to not parse the same files again
+    :param cache_dir: Persistent cache directory for binary copies of the CSV files, shared between processes
+    :param content_hash: Key the persistent cache additionally by the content of the CSV files
+    :param prefetch: Number of upcoming groups loaded in background threads while the current one is processed
+    :param workers: Number of background threads used to load the prefetched groups
+    :param groups: Names of the groups to load, e.g. selected with a SuiteCatalog, all groups if None
+    :param compact: Load the value columns as value_dtype and is_anomaly as int8 with explicit dtypes while parsing
+    :param value_dtype: Data type of the value columns in the compact mode, e.g. 'float32' for half the memory
+    :param url: Address of a published suite folder with a manifest.json, only the groups are downloaded from it
+    :param verify: Check the stored files against the manifest of the suite first: 'stat' or 'hash',
+                   missing or changed groups are restored
+    :return: Generator of (name, config, train, test)
+    """
     # check suite availability
-    check_suite_availability(benchmark)
+    if url is not None:
+        fetch_groups(benchmark, url, groups)
+    else:
+        check_suite_availability(benchmark, verify=verify, groups=groups)
     # run suite iterator
     base_path = get_default_path(benchmark)
     print(base_path)
-    dataset_cache = {}
-    configs = {}
-    for c in Path(base_path).glob("*.yaml"):
-        with open(c, "r+") as f:
-            config = yaml.safe_load(f)
-            name = list(filter(lambda x: "timeseries" in x, config.keys()))[0]
-            for sequence in config[name]:
-                sequence["origin"] = c.name
-                configs[sequence["name"]] = sequence
-
-    def _reduce_cache():
-        remove_list = []
-        for k, v in dataset_cache.items():
-            v["cache"] -= 1
-            if v["cache"] <= 0:
-                remove_list.append(k)
-        for r in remove_list:
-            dataset_cache.pop(r)
-
-    def _drop_not_relevant_columns(df: pd.DataFrame):
-        return df.loc[:, ~df.columns.str.startswith('permutation_')]
+    if cache is None:
+        cache = DatasetCache()
+    configs = load_configs(base_path)
+
+    def _read_sequence(path: Path):
+        with measure("read", benchmark=benchmark, group=path.parent.name, sequence=path.name) as record:
+            sequence, source = _parse_sequence(path)
+            if source is not None and enabled():
+                record.update(path=str(source), bytes=source.stat().st_size, rows=len(sequence["timestamp"]))
+        return sequence
+
+    def _parse_sequence(path: Path):
+        # prefer the binary format, the permutation columns are not read at all
+        npz_path = path.with_suffix(".npz").absolute()
+        # plain or compressed CSV file
+        csv_path = csv_file(path)
+        cached = not npz_path.exists() and csv_path is not None and cache_dir is not None
+        if cached:
+            npz_path = get_cached_npz(csv_path, cache_dir, content_hash)
+        if npz_path.exists():
+            if mmap:
+                return map_npz(npz_path), npz_path
+            sequence = load_npz(npz_path, value_dtype=value_dtype if compact else None)
+            if cached and not compact:
+                # the same dtypes as parsing the CSV file, the cache is only a faster way to read it
+                values = [c for c in sequence.columns if c.startswith("value-")]
+                sequence[values] = sequence[values].astype(np.float64)
+                sequence["is_anomaly"] = sequence["is_anomaly"].astype(np.int64)
+            return sequence, npz_path
+        if csv_path is not None:
+            if mmap:
+                raise FileExistsError(f"Binary sequence {npz_path} not available, convert the suite with: "
+                                      f"python storage.py {base_path} --to npz or use a cache_dir")
+            # the permutation columns are skipped while parsing
+            return read_csv(csv_path.absolute(), compact=compact, value_dtype=value_dtype), csv_path
+        return None, None
 
     def _load_from_path(path):
-        if path.name in dataset_cache:
-            # update cache counter
-            dataset_cache[path.name]["cache"] = 5
-            cache_entry = dataset_cache[path.name]
+        with measure("load", benchmark=benchmark, group=path.name) as record:
+            return _load_group(path, record)
+
+    def _load_group(path, record):
+        cache_key = (str(path), mmap, compact, value_dtype)
+        cache_entry = cache.get(cache_key)
+        record["cache_hit"] = cache_entry is not None
+        if cache_entry is not None:
             return path.name, configs[path.name], \
                 cache_entry["train_no_anomaly"], cache_entry["train"], cache_entry["test"]
         else:
-            train_no_anomaly_sequence = Path(f"{path}/train_no_anomaly.csv")
-            train_sequence = Path(f"{path}/train_anomaly.csv")
-
-            if train_no_anomaly_sequence.exists():
-                train_no_anomaly_sequence = _drop_not_relevant_columns(
-                    pd.read_csv(train_no_anomaly_sequence.absolute()))
-            else:
-                train_no_anomaly_sequence = None
+            train_no_anomaly_sequence = _read_sequence(Path(f"{path}/train_no_anomaly"))
 
-            if train_sequence.exists():
-                train_sequence = _drop_not_relevant_columns(pd.read_csv(train_sequence.absolute()))
-            else:
+            train_sequence = _read_sequence(Path(f"{path}/train_anomaly"))
+            if train_sequence is None:
                 raise FileExistsError("Train sequence not available")
 
-            test_sequence = Path(f"{path}/test.csv")
-            if test_sequence.exists():
-                test_sequence = _drop_not_relevant_columns(pd.read_csv(test_sequence.absolute()))
-            else:
+            test_sequence = _read_sequence(Path(f"{path}/test"))
+            if test_sequence is None:
                 raise FileExistsError("Test sequence not available")
 
-            dataset_cache[path.name] = {"cache": 5,
-                                        "train_no_anomaly": train_no_anomaly_sequence,
-                                        "train": train_sequence,
-                                        "test": test_sequence}
+            cache.put(cache_key, {"train_no_anomaly": train_no_anomaly_sequence,
+                                  "train": train_sequence,
+                                  "test": test_sequence})
 
             return path.name, configs[path.name], train_no_anomaly_sequence, train_sequence, test_sequence
 
-    sorted_dataset_list = sorted(list(Path(base_path).glob("*")))
-    for p in sorted_dataset_list:
-        if Path(p).is_dir():
-            _reduce_cache()
-            name, config, train_no_anomaly, train, test = _load_from_path(p)
-            if train_no_anomaly is not None:
-                yield name + "-no-anomaly", config, train_no_anomaly, test
-            yield name, config, train, test
+    def _sequences(loaded):
+        name, config, train_no_anomaly, train, test = loaded
+        if train_no_anomaly is not None:
+            yield name + "-no-anomaly", config, train_no_anomaly, test
+        yield name, config, train, test
+
+    # only the groups listed in the overviews, not e.g. a staging folder of a running generation
+    sorted_dataset_list = [p for p in sorted(Path(base_path).glob("*")) if Path(p).is_dir() and p.name in configs]
+    if groups is not None:
+        missing = set(groups) - {p.name for p in sorted_dataset_list}
+        if len(missing) > 0:
+            raise ValueError(f"Sequence groups not available: {sorted(missing)}")
+        sorted_dataset_list = [p for p in sorted_dataset_list if p.name in set(groups)]
+    if prefetch <= 0:
+        for p in sorted_dataset_list:
+            yield from _sequences(_load_from_path(p))
+        return
+
+    # keep the next groups loading in the background, hand them over in the same order
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for p in sorted_dataset_list:
+            pending.append(executor.submit(_load_from_path, p))
+            if len(pending) > prefetch:
+                yield from _sequences(pending.popleft().result())
+        while pending:
+            yield from _sequences(pending.popleft().result())
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class SuiteCatalog:
+    """
+    Index of the sequence groups of a benchmark suite built from its overview*.yaml files
+    Selecting and accessing entries only reads the metadata, the sequences are loaded on request.
+    """
+
+    def __init__(self, benchmark: str = "fsb"):
+        check_suite_availability(benchmark)
+        self.benchmark = benchmark
+        self.base_path = get_default_path(benchmark)
+        configs = load_configs(self.base_path)
+        self.entries = []
+        for path in sorted(Path(self.base_path).glob("*")):
+            if not path.is_dir() or path.name not in configs:
+                continue
+            config = configs[path.name]
+            self.entries.append({
+                "name": path.name,
+                "channels": config.get("channels"),
+                "length": _sequence_length(path, config),
+                "kinds": sorted({k["kind"] for a in config.get("anomalies", []) for k in a.get("kinds", [])}),
+                "origin": config["origin"],
+                "files": {f.name: f.stat().st_size for f in sorted(path.iterdir()) if f.is_file()},
+                "config": config,
+            })
+        self._index = {e["name"]: i for i, e in enumerate(self.entries)}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, key):
+        """
+        :param key: Position or name of a group
+        """
+        if isinstance(key, str):
+            try:
+                return self.entries[self._index[key]]
+            except KeyError:
+                raise KeyError(f"Sequence group '{key}' not available in suite {self.benchmark}")
+        return self.entries[key]
+
+    def index(self, name: str):
+        return self._index[name]
+
+    def select(self, name: str = None, channels=None, kind: str = None, origin: str = None,
+               min_length: int = None, max_length: int = None):
+        """
+        Filter the groups of the suite, all given conditions have to match
+        :param name: Substring of the group name
+        :param channels: Number or list of numbers of channels
+        :param kind: Anomaly kind, e.g. 'signal-cut-match' or 'platform'
+        :param origin: Overview file the group is listed in, e.g. 'overview-gutentag.yaml'
+        :param min_length: Minimal number of rows
+        :param max_length: Maximal number of rows
+        :return: List of matching entries
+        """
+        if isinstance(channels, int):
+            channels = [channels]
+        selected = []
+        for e in self.entries:
+            if name is not None and name not in e["name"]:
+                continue
+            if channels is not None and e["channels"] not in channels:
+                continue
+            if kind is not None and kind not in e["kinds"]:
+                continue
+            if origin is not None and e["origin"] != origin:
+                continue
+            if min_length is not None and (e["length"] is None or e["length"] < min_length):
+                continue
+            if max_length is not None and (e["length"] is None or e["length"] > max_length):
+                continue
+            selected.append(e)
+        return selected
+
+    def load(self, entries=None, **kwargs):
+        """
+        Load only the given groups, accepts the same arguments as load_all_stored_datasets
+        :param entries: Entries or names of the groups to load, all groups if None
+        :return: Generator of (name, config, train, test)
+        """
+        groups = None
+        if entries is not None:
+            groups = [e if isinstance(e, str) else e["name"] for e in entries]
+        return load_all_stored_datasets(self.benchmark, groups=groups, **kwargs)
+
+
+def iter_windows(benchmark: str, name: str, split: str = "test", window: int = 1000, stride: int = None,
+                 chunk_rows: int = 100_000):
+    """
+    Iterate over one stored sequence in fixed windows without loading it at once
+    Binary stored sequences are sliced from a memory map, CSV files are parsed in chunks of chunk_rows.
+    :param benchmark: Name of the benchmark suite: 'fsb' or 'srb'
+    :param name: Name of the sequence group
+    :param split: Sequence of the group: 'train', 'train_no_anomaly' or 'test'
+    :param window: Number of rows per window, the last window can be shorter
+    :param stride: Number of rows between the starts of two windows, smaller than window for overlapping windows
+    :param chunk_rows: Number of rows parsed at once from a CSV file
+    :return: Generator of (timestamps, values(rows, channels), is_anomaly) NumPy blocks
+    """
+    if stride is None:
+        stride = window
+    if window <= 0 or stride <= 0:
+        raise ValueError("window and stride need to be positive")
+    try:
+        file_name = split_file_name[split]
+    except KeyError:
+        raise ValueError(f"Split '{split}' not available")
+    check_suite_availability(benchmark)
+    path = Path(f"{get_default_path(benchmark)}/{name}/{file_name}")
+
+    if path.with_suffix(".npz").exists():
+        sequence = map_npz(path.with_suffix(".npz"))
+        rows = sequence["timestamp"].shape[0]
+        for start in range(0, rows, stride):
+            yield sequence["timestamp"][start:start + window], sequence["values"][start:start + window], \
+                sequence["is_anomaly"][start:start + window]
+            if start + window >= rows:
+                break
+        return
+
+    csv_path = csv_file(path)
+    if csv_path is None:
+        raise FileExistsError(f"Sequence {path} not available")
+    # rows of the file kept in memory, starting at the absolute row offset
+    timestamps, values, labels = None, None, None
+    offset = 0
+    start = 0
+    end = 0
+    with pd.read_csv(csv_path, chunksize=chunk_rows, usecols=lambda c: not c.startswith(permutation_prefix)) as reader:
+        for chunk in reader:
+            value_columns = [c for c in chunk.columns if c.startswith("value-")]
+            if timestamps is None:
+                timestamps = chunk["timestamp"].to_numpy()
+                values = chunk[value_columns].to_numpy()
+                labels = labels_to_int8(chunk["is_anomaly"])
+            else:
+                timestamps = np.concatenate([timestamps, chunk["timestamp"].to_numpy()])
+                values = np.concatenate([values, chunk[value_columns].to_numpy()])
+                labels = np.concatenate([labels, labels_to_int8(chunk["is_anomaly"])])
+            while start + window <= offset + timestamps.shape[0]:
+                s = start - offset
+                yield timestamps[s:s + window], values[s:s + window], labels[s:s + window]
+                end = start + window
+                start += stride
+            # forget the rows no upcoming window needs
+            drop = min(start - offset, timestamps.shape[0])
+            timestamps, values, labels = timestamps[drop:], values[drop:], labels[drop:]
+            offset += drop
+    if timestamps is not None and end < offset + timestamps.shape[0] and start < offset + timestamps.shape[0]:
+        s = start - offset
+        yield timestamps[s:], values[s:], labels[s:]
 
 
 if __name__ == "__main__":
-    # find index of a sequence to seek to a start or end point
-    sets = list(load_all_stored_datasets("fsb"))
-    for i, (n, c, _, _) in enumerate(sets):
-        if n == '2-saw-all-no-anomaly':
-            print(i, n, c)
+    # find a sequence group without loading the suite
+    catalog = SuiteCatalog("fsb")
+    entry = catalog["2-saw-all"]
+    print(catalog.index(entry["name"]), entry["name"], entry["config"])
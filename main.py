@@ -1,80 +1,188 @@
 import argparse
+import hashlib
+import inspect
+import json
 import random
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
 from pathlib import Path
-from shutil import rmtree
+from shutil import move, rmtree
 
 import yaml
 from tqdm import tqdm
 
 from generators import *
+from instrumentation import JsonLinesHook, add_hook, init_worker, measure
+from storage import CsvWriter, NpzWriter, YamlLoader, csv_suffixes, load_configs, save_npz, write_csv, write_manifest
+from suites import ALL_ADVANCED, ALL_BASE, CORRELATION, PREDATOR_PRAY, SIMPLE_INCREASING, STD_CUT_INCREASING, \
+    STD_CUT_WAVE, VARIANTS, WAVE, generator_key, plan_suite, plan_variants, suite_config
 
 random.seed(42)
 np.random.seed(42)
 
-# [3]
-SIMPLE_INCREASING = [
-    generate_simple_increasing_data,
-    generate_saw_data,
-    generate_4_saw_data,
-]
-
-# [12]
-STD_CUT_INCREASING = [
-    *[generate_std_cut_increasing_data_dynamic(2, i) for i in [10, 40, 70]],
-    *[generate_std_cut_increasing_data_dynamic(3, i) for i in [10, 40, 70]],
-    *[generate_std_cut_continue_increasing_data_dynamic(2, i) for i in [10, 30, 50]],
-    *[generate_std_cut_continue_increasing_data_dynamic(3, i) for i in [10, 30, 50]]
-]
-
-# [8]
-WAVE = [
-    generate_simple_wave_data,
-    generate_synced_wave_data,
-    generate_off_synced_wave_data,
-    generate_light_off_synced_wave_data,
-    # 4
-    generate_4_simple_wave_data,
-    generate_no_synced_cut_wave_data,
-    generate_medium_past_std_cut_wave_data,
-    generate_big_past_std_cut_wave_data
-]
-
-# [5]
-# Published version of this sequences can not be regenerated
-# They were added later and not in a full generation run
-CORRELATION = [
-    generate_correlation_data,
-    generate_correlation_2_data,
-    generate_correlation_2_trend_data,
-    generate_correlation_2_trend_strong_data,
-    # 4
-    generate_correlation_2_high_corr_data
-]
-
-# [6]
-STD_CUT_WAVE = [
-    generate_std_cut_wave_data_dynamic(sequences, pre_std_ration, pre_std_past)
-    for sequences in [2, 4]
-    for pre_std_ration in [2]
-    for pre_std_past in [10, 30, 70]]
-
-# [34]
-ALL_BASE = [*SIMPLE_INCREASING, *WAVE, *STD_CUT_INCREASING, *STD_CUT_WAVE, *CORRELATION]
-
-# [4]
-PREDATOR_PRAY = [
-    generate_4_3_prey_2_predator_500_cooldown_1_mil_steps,
-    generate_4_3_prey_2_predator_300_cooldown_short,
-    generate_4_2_prey_2_predator_1000_cooldown_1_mil_steps,
-    generate_4_2_prey_2_predator_300_cooldown_short
-]
-
-ALL_ADVANCED = [*PREDATOR_PRAY]
-
-suite_config = {
-    "FSB": ALL_BASE,
-    "SRB": ALL_ADVANCED
-}
+# fingerprint of the generation of a sequence group stored in its folder
+stamp_name = ".fingerprint.json"
+
+
+def source_hash(f):
+    """
+    Hash of the source code of a generator and of all functions of its module it calls, directly or nested
+    """
+    sources = {}
+    stack = [f]
+    # closures of the dynamic generators are defined in a factory that also holds parameters
+    outer = f.__globals__.get(f.__qualname__.split(".")[0])
+    if inspect.isfunction(outer):
+        stack.append(outer)
+    while len(stack) > 0:
+        fn = stack.pop()
+        if fn.__qualname__ in sources:
+            continue
+        sources[fn.__qualname__] = inspect.getsource(fn)
+        codes = [fn.__code__]
+        while len(codes) > 0:
+            code = codes.pop()
+            codes.extend(c for c in code.co_consts if inspect.iscode(c))
+            for n in code.co_names:
+                obj = fn.__globals__.get(n)
+                if inspect.isfunction(obj) and obj.__module__ == fn.__module__:
+                    stack.append(obj)
+    digest = hashlib.sha256()
+    for qualname in sorted(sources):
+        digest.update(sources[qualname].encode())
+    return digest.hexdigest()
+
+
+def code_fingerprint(f, formats, value_dtype, float_format=None, compression=None):
+    """
+    Fingerprint of everything but the random stream that determines the stored files of a suite entry
+    """
+    defaults = {k: p.default for k, p in inspect.signature(f).parameters.items()
+                if p.default is not inspect.Parameter.empty}
+    content = json.dumps({
+        "generator": generator_key(f),
+        "defaults": repr(defaults),
+        "variants": {variant: VARIANTS[variant] for variant in plan_variants(f)},
+        "source": source_hash(f),
+        "formats": sorted(formats),
+        "value_dtype": value_dtype,
+        "float_format": float_format,
+        "compression": compression,
+    }, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()
+
+
+def rng_digest():
+    """
+    Fingerprint of the current state of the global random stream
+    """
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return hashlib.sha256(keys.tobytes() + f"/{pos}/{has_gauss}/{cached_gaussian}".encode()).hexdigest()
+
+
+def get_rng_state():
+    _, keys, pos, has_gauss, cached_gaussian = np.random.get_state()
+    return {"keys": keys.tolist(), "pos": pos, "has_gauss": has_gauss, "cached_gaussian": cached_gaussian}
+
+
+def set_rng_state(state):
+    np.random.set_state(("MT19937", np.array(state["keys"], dtype=np.uint32), state["pos"], state["has_gauss"],
+                         state["cached_gaussian"]))
+
+
+def read_stamps(base_path):
+    """
+    Fingerprints of the stored sequence groups of a suite
+    :return: Dict of generator key to its stamp, including the name of the group folder
+    """
+    stamps = {}
+    for p in Path(base_path).glob(f"*/{stamp_name}"):
+        try:
+            with open(p, "r") as f:
+                stamp = json.load(f)
+        except (OSError, ValueError):
+            continue
+        stamp["group"] = p.parent.name
+        stamps[stamp["generator"]] = stamp
+    return stamps
+
+
+def read_overview(base_path, name):
+    """
+    Parameters of the groups of the last generation run by group name
+    """
+    if not Path(f"{base_path}/overview.yaml").exists():
+        return {}
+    with open(f"{base_path}/overview.yaml", "r") as f:
+        config = yaml.load(f, Loader=YamlLoader)
+    return {c["name"]: c for c in config.get(name, [])}
+
+
+def file_suffixes(formats, compression=None):
+    """
+    Suffixes of the stored files of a sequence
+    """
+    return [csv_suffixes[compression] if fmt == "csv" else f".{fmt}" for fmt in formats]
+
+
+def is_up_to_date(stamp, code, seed, base_path, overview, variants, suffixes):
+    """
+    Check if a stored group was generated with the same fingerprint and all its files exist
+    """
+    return stamp is not None and stamp["code"] == code and stamp["seed"] == seed and stamp["group"] in overview \
+        and all(Path(f"{base_path}/{stamp['group']}/{variant}{suffix}").exists()
+                for variant in variants for suffix in suffixes)
+
+
+def write_stamp(path, stamp):
+    with open(f"{path}/{stamp_name}", "w") as f:
+        json.dump(stamp, f)
+
+
+def generate_variant(suite, index, variant, seed=None, plot=False, staging=None, formats=("csv",),
+                     value_dtype="float64", float_format=None, compression=None):
+    """
+    Generate one variant of a suite entry
+    :param suite: Name of the benchmark suite: 'FSB' or 'SRB'
+    :param index: Position of the generator in the suite
+    :param variant: Name of the variant from VARIANTS
+    :param seed: Seed of the task, None continues the current global random stream
+    :param plot: Render the sequence after generation
+    :param staging: Folder to store the sequence in as {index}-{variant}.csv / .npz
+    :param formats: File formats to store: 'csv' and/or 'npz'
+    :param value_dtype: Data type of the value columns in the binary format
+    :param float_format: printf style format of the CSV values, e.g. %.8g, None for the full precision
+    :param compression: Compression of the CSV files: None, 'gzip' or 'zstd'
+    :return: Parameters and group of the generated sequence
+    """
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    f = suite_config[suite][index]
+    with measure("generate", memory=True, suite=suite, index=index, variant=variant) as record:
+        if staging is not None and not plot and "sink" in inspect.signature(f).parameters:
+            # long sequences are written chunk by chunk while they are generated, the time includes the writing
+            with ExitStack() as stack:
+                writers = []
+                if "csv" in formats:
+                    writers.append(stack.enter_context(
+                        CsvWriter(f"{staging}/{index}-{variant}{csv_suffixes[compression]}", float_format,
+                                  compression)))
+                if "npz" in formats:
+                    writers.append(stack.enter_context(NpzWriter(f"{staging}/{index}-{variant}.npz", value_dtype)))
+                _, params, group = f(**VARIANTS[variant], sink=lambda chunk: [w(chunk) for w in writers],
+                                     plot=plot)
+            record.update(group=group, rows=writers[0].rows, streamed=True)
+            return params, group
+        df, params, group = f(**VARIANTS[variant], plot=plot)
+        record.update(group=group, rows=len(df), streamed=False)
+    if staging is not None:
+        if "csv" in formats:
+            write_csv(df, f"{staging}/{index}-{variant}{csv_suffixes[compression]}", float_format, compression)
+        if "npz" in formats:
+            save_npz(df, f"{staging}/{index}-{variant}.npz", value_dtype)
+    return params, group
 
 
 def parse_args():
@@ -89,6 +197,31 @@ def parse_args():
                         help="Generate sequences interactively with with user input to continue: 'yes' or 'no'")
     parser.add_argument("--remove_orphan_only", type=str, default="no",
                         help="Remove orphan sequences only: 'yes' or 'no'")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="Global seed of the generation run")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Generate the variants of all sequences in a pool of N processes, each with a seed "
+                             "derived from the global seed. Without it the sequences are generated one after "
+                             "the other from the global random stream like the published suites")
+    parser.add_argument("--format", type=str, default="csv", choices=['csv', 'npz', 'both'],
+                        help="File format of the saved sequences: TimeEval 'csv', binary 'npz' or 'both'")
+    parser.add_argument("--value_dtype", type=str, default="float64", choices=['float64', 'float32'],
+                        help="Data type of the value columns in the binary format")
+    parser.add_argument("--float_format", type=str, default=None,
+                        help="printf style format of the CSV values, e.g. %%.8g for a faster export and smaller "
+                             "files. Without it the values are written with full precision")
+    parser.add_argument("--compression", type=str, default="none", choices=['none', 'gzip', 'zstd'],
+                        help="Compression of the CSV files: 'none', 'gzip' or 'zstd'")
+    parser.add_argument("--force", type=str, default="no",
+                        help="Regenerate all sequences, also the ones whose fingerprint is unchanged: 'yes' or 'no'")
+    parser.add_argument("--dry_run", type=str, default="no",
+                        help="Only report which sequences would be regenerated: 'yes' or 'no'")
+    parser.add_argument("--metrics", type=str, default=None,
+                        help="Append the generation time, rows and write time of every sequence as JSON lines "
+                             "to this file")
+    parser.add_argument("--metrics_memory", type=str, default="no",
+                        help="Add the peak memory of every generation to the metrics, slows down the generators: "
+                             "'yes' or 'no'")
     return parser.parse_args()
 
 
@@ -100,53 +233,135 @@ if __name__ == "__main__":
     LIST = suite_config[args.suite]
 
     plot = args.plot == "yes"
+    formats = ("csv", "npz") if args.format == "both" else (args.format,)
+    compression = None if args.compression == "none" else args.compression
+    metrics = None
+    if args.metrics is not None:
+        metrics = JsonLinesHook(args.metrics)
+        add_hook(metrics, args.metrics_memory == "yes")
     if args.remove_orphan_only == "no":
         configs = {name: []}
-        for i, f in tqdm(enumerate(LIST)):
-            df, params, group = f(plot=plot)
+        staging = None
+        # groups whose fingerprint matches the stored one are kept as they are
+        incremental = args.save == "yes" and args.force == "no"
+        stamps = read_stamps(base_path) if incremental else {}
+        overview = read_overview(base_path, name) if incremental else {}
+        codes = [code_fingerprint(f, formats, args.value_dtype, args.float_format, compression) for f in LIST]
+        # with workers every task has its own seed, else the entries continue the global random stream
+        seed_id = None if args.workers is None else f"tasks-{args.seed}"
+
+        def up_to_date(i, seed_id):
+            return incremental and is_up_to_date(stamps.get(generator_key(LIST[i])), codes[i], seed_id, base_path,
+                                                 overview, plan_variants(LIST[i]), file_suffixes(formats, compression))
+
+        if args.dry_run == "yes":
+            random.seed(args.seed)
+            np.random.seed(args.seed)
+            stream_known = True
+            for i, f in enumerate(LIST):
+                stamp = stamps.get(generator_key(f))
+                label = stamp["group"] if stamp is not None else generator_key(f)
+                if args.workers is not None or stream_known:
+                    current = seed_id if args.workers is not None else rng_digest()
+                    if up_to_date(i, current):
+                        if args.workers is None:
+                            set_rng_state(stamp["rng_state"])
+                        print(f"unchanged: {label}")
+                    else:
+                        print(f"regenerate: {label}")
+                        stream_known = args.workers is not None
+                elif up_to_date(i, stamp["seed"] if stamp is not None else None):
+                    print(f"unchanged if the random stream before it is unchanged: {label}")
+                else:
+                    print(f"regenerate: {label}")
+        else:
+            if args.save == "yes":
+                Path(base_path).mkdir(parents=True, exist_ok=True)
+                staging = tempfile.mkdtemp(prefix=".staging-", dir=base_path)
+
+            # a failing or interrupted run must not leave the staging folder as a group in the suite
             try:
-                df_no_anomaly, _, _ = f(anomaly=False, plot=plot)
-            except TypeError as e:
-                print(i, f, e)
+                tasks = plan_suite(args.suite, None if args.workers is None else args.seed)
+                results = {}
+                skipped = set()
+                if args.workers is not None:
+                    skipped = {i for i in range(len(LIST)) if up_to_date(i, seed_id)}
+                    # the workers append their records to the same file
+                    hook = {} if metrics is None else {"initializer": init_worker,
+                                                       "initargs": (metrics, args.metrics_memory == "yes")}
+                    with ProcessPoolExecutor(max_workers=args.workers, **hook) as pool:
+                        futures = {pool.submit(generate_variant, args.suite, i, variant, s, plot, staging, formats,
+                                               args.value_dtype, args.float_format, compression): (i, variant)
+                                   for i, variant, s in tasks if i not in skipped}
+                        for future in tqdm(as_completed(futures), total=len(futures)):
+                            results[futures[future]] = future.result()
+                else:
+                    random.seed(args.seed)
+                    np.random.seed(args.seed)
+
+                for i, f in tqdm(enumerate(LIST), disable=args.workers is not None):
+                    stamp = stamps.get(generator_key(f))
+                    if args.workers is None:
+                        seed_id = rng_digest()
+                        if up_to_date(i, seed_id):
+                            # continue the random stream as if the group was generated
+                            set_rng_state(stamp["rng_state"])
+                            skipped.add(i)
+                        else:
+                            for j, variant, s in tasks:
+                                if j == i:
+                                    results[(i, variant)] = generate_variant(args.suite, i, variant, s, plot, staging,
+                                                                             formats, args.value_dtype,
+                                                                             args.float_format, compression)
+                    if i in skipped:
+                        configs[name].append(overview[stamp["group"]])
+                        continue
+                    params, group = results[(i, "train_anomaly")]
+                    if args.save == "yes":
+                        params["name"] = group
+                        configs[name].append(params)
+                        # remove existing folder
+                        if Path(f"{base_path}/{group}").exists():
+                            rmtree(f"{base_path}/{group}", ignore_errors=False)
+                        # save new stuff
+                        Path(f"{base_path}/{group}").mkdir(parents=True, exist_ok=True)
+                        for variant in VARIANTS:
+                            for staged in Path(staging).glob(f"{i}-{variant}.*"):
+                                suffix = staged.name[len(f"{i}-{variant}"):]
+                                move(staged, f"{base_path}/{group}/{variant}{suffix}")
+                        write_stamp(f"{base_path}/{group}", {
+                            "generator": generator_key(f), "code": codes[i], "seed": seed_id,
+                            "rng_state": get_rng_state() if args.workers is None else None})
+                    if args.interactive == "yes":
+                        print(f'Showing: {group}')
+                        input('Next <Enter>')
+                    pass
+                pass
+                if len(skipped) > 0:
+                    print(f"Kept {len(skipped)} unchanged sequence groups")
+            finally:
+                if staging is not None:
+                    rmtree(staging, ignore_errors=True)
+
             if args.save == "yes":
-                params["name"] = group
-                configs[name].append(params)
-                # remove existing folder
-                if Path(f"{base_path}/{group}").exists():
-                    rmtree(f"{base_path}/{group}", ignore_errors=False)
-                # save new stuff
-                Path(f"{base_path}/{group}").mkdir(parents=True, exist_ok=True)
-                # save training without anomaly
-                df_no_anomaly.to_csv(f"{base_path}/{group}/train_no_anomaly.csv", sep=",", index=False)
-                # save training
-                df.to_csv(f"{base_path}/{group}/train_anomaly.csv", sep=",", index=False)
-                # save test
-                df, _, _ = f(plot=plot)
-                df.to_csv(f"{base_path}/{group}/test.csv", sep=",", index=False)
-            if args.interactive == "yes":
-                print(f'Showing: {group}')
-                input('Next <Enter>')
-            pass
-        pass
-
-        if args.save == "yes":
-            if Path(f"{base_path}/overview.yaml").exists():
-                Path(f"{base_path}/overview.yaml").unlink()
-            with open(f"{base_path}/overview.yaml", "w+") as f:
-                yaml.dump(configs, f, allow_unicode=True)
+                if Path(f"{base_path}/overview.yaml").exists():
+                    Path(f"{base_path}/overview.yaml").unlink()
+                with open(f"{base_path}/overview.yaml", "w+") as f:
+                    yaml.dump(configs, f, allow_unicode=True)
+
+    if args.dry_run == "yes":
+        exit(0)
 
     # clean up orphan sequences
     print("Cleaning up orphan sequences from suite")
-    datasets_folders = []
-    for c in Path(f"{base_path}").glob("*.yaml"):
-        with open(c, "r+") as f:
-            config = yaml.safe_load(f)
-            name = list(filter(lambda x: "timeseries" in x, config.keys()))[0]
-            for t in config[name]:
-                datasets_folders.append(t["name"])
+    datasets_folders = list(load_configs(base_path).keys())
 
     for d in Path(f"{base_path}").glob("*"):
         if d.is_dir():
             if d.name not in datasets_folders:
                 print(f"Removing orphan sequence: {d}")
                 rmtree(d, ignore_errors=False)
+
+    if args.save == "yes":
+        # sizes and hashes of the files to publish the sequence groups separately
+        write_manifest(base_path)
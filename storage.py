@@ -0,0 +1,634 @@
+import argparse
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from instrumentation import emit, enabled, measure
+
+permutation_prefix = "permutation_"
+# suffixes of the CSV files by compression, pandas picks the decompression from the suffix
+csv_suffixes = {None: ".csv", "gzip": ".csv.gz", "zstd": ".csv.zst"}
+# compiled metadata of the overview*.yaml files of a suite folder
+overview_index_name = ".overview-index"
+# files of a suite folder with their sizes and hashes, to download single sequence groups
+manifest_name = "manifest.json"
+# use the libyaml bindings when PyYAML was built with them
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _umask():
+    """
+    File mode creation mask of the process, from /proc on Linux
+    Elsewhere it can only be read by setting it, it is restored right away but another thread creating a file
+    in between would get the mask 0o022.
+    """
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+def default_permissions(path):
+    """
+    Give a file created with tempfile.mkstemp the permissions of a file created with open, mkstemp makes it
+    readable for the owner only and os.replace keeps that
+    """
+    os.chmod(path, 0o666 & ~_umask())
+
+
+def labels_to_int8(is_anomaly: pd.Series):
+    """
+    Convert the is_anomaly column to int8, the semi-realistic suite flags anomalies with True
+    """
+    if is_anomaly.dtype.kind in "biuf":
+        return is_anomaly.to_numpy().astype(np.int8)
+    if isinstance(is_anomaly.dtype, pd.CategoricalDtype):
+        # only the few distinct labels are compared, missing labels (code -1) are no anomaly
+        flags = np.append(is_anomaly.cat.categories.astype(str).isin(["1", "True"]), False)
+        return flags[is_anomaly.cat.codes.to_numpy()].astype(np.int8)
+    return is_anomaly.astype(str).isin(["1", "True"]).to_numpy().astype(np.int8)
+
+
+def _npz_arrays(df: pd.DataFrame, value_dtype=np.float64):
+    value_columns = [c for c in df.columns if c.startswith("value-")]
+    permutation_columns = [c for c in df.columns if c.startswith(permutation_prefix)]
+    arrays = {
+        "timestamp": df["timestamp"].to_numpy(),
+        "columns": np.array(value_columns, dtype=str),
+        "values": df[value_columns].to_numpy(dtype=value_dtype),
+        "is_anomaly": labels_to_int8(df["is_anomaly"]),
+        "permutation_columns": np.array(permutation_columns, dtype=str),
+    }
+    for k, c in enumerate(permutation_columns):
+        arrays[f"permutation-{k}"] = df[c].to_numpy()
+    return arrays
+
+
+def save_npz(df: pd.DataFrame, path, value_dtype=np.float64):
+    """
+    Store a sequence in the columnar binary format next to the TimeEval CSV layout
+    The values are stored as one (rows, channels) array, the labels as int8 and the
+    permutation_* columns of the semi-realistic suite as separate members that are only read on request.
+    :param df: Sequence with the columns timestamp,value-0,value-1,…,is_anomaly
+    :param path: Target file, should end with .npz
+    :param value_dtype: Data type of the value columns
+    """
+    with measure("write", format="npz", path=str(path), rows=len(df)) as record:
+        # uncompressed, every member stays a plain .npy file inside the archive
+        np.savez(path, **_npz_arrays(df, value_dtype))
+        if enabled():
+            record["bytes"] = os.path.getsize(path)
+
+
+def csv_file(path):
+    """
+    Stored CSV file of a sequence, plain or compressed
+    :param path: Sequence without suffix, e.g. fsb_timeseries/2-saw-all/test
+    :return: Path of the existing file or None
+    """
+    for suffix in csv_suffixes.values():
+        if Path(f"{path}{suffix}").exists():
+            return Path(f"{path}{suffix}")
+    return None
+
+
+def read_csv(path, permutation=False, compact=False, value_dtype=np.float64) -> pd.DataFrame:
+    """
+    Load a CSV stored sequence, plain or compressed
+    :param path: File to load
+    :param permutation: Include the permutation_* columns, otherwise they are skipped while parsing
+    :param compact: Parse with explicit dtypes, the value columns as value_dtype and is_anomaly as int8 like load_npz
+    :param value_dtype: Data type of the value columns in the compact mode
+    :return: Sequence with the columns timestamp,value-0,value-1,…,is_anomaly
+    """
+    columns = pd.read_csv(path, nrows=0).columns.tolist()
+    usecols = [c for c in columns if permutation or not c.startswith(permutation_prefix)]
+    if not compact:
+        return pd.read_csv(path, usecols=usecols)
+    # labels are 0/1 or 0/True, as category only the distinct values are converted
+    dtype = {c: value_dtype for c in usecols if c.startswith("value-")}
+    dtype["is_anomaly"] = "category"
+    df = pd.read_csv(path, usecols=usecols, dtype=dtype)
+    df["is_anomaly"] = labels_to_int8(df["is_anomaly"])
+    return df
+
+
+def format_csv(df: pd.DataFrame, float_format: str, header=True):
+    """
+    TimeEval CSV text of a sequence, each cell is formatted with the Python % operator on the plain floats of
+    its column and the cells are joined per row, without the per cell overhead of DataFrame.to_csv
+    :param df: Sequence with the columns timestamp,value-0,value-1,…,is_anomaly
+    :param float_format: printf style format of the value columns, e.g. %.8g, %r keeps the full precision,
+                         the timestamps always keep their full precision
+    :param header: Include the header line
+    :return: Text with the same layout as DataFrame.to_csv(index=False)
+    """
+    columns = []
+    for c in df.columns:
+        values = df[c].to_numpy()
+        if values.dtype.kind == "f":
+            cells = [(float_format if c != "timestamp" else "%r") % v for v in values.tolist()]
+            if np.isnan(values).any():
+                # empty like DataFrame.to_csv
+                cells = ["" if np.isnan(v) else cell for v, cell in zip(values.tolist(), cells)]
+        elif values.dtype.kind == "b":
+            cells = np.where(values, "True", "False").tolist()
+        else:
+            cells = [str(v) for v in values.tolist()]
+        columns.append(cells)
+    lines = map(",".join, zip(*columns))
+    if header:
+        lines = itertools.chain([",".join(df.columns)], lines)
+    return os.linesep.join(lines) + os.linesep
+
+
+class CsvWriter:
+    """
+    Append the chunks of a sequence to a TimeEval CSV file while it is generated
+    Without float_format the file has the same content as writing the whole sequence with DataFrame.to_csv.
+    Use it as context manager and pass it as sink to a generator.
+    """
+
+    def __init__(self, path, float_format: str = None, compression: str = None, block_rows: int = 2 ** 16):
+        """
+        :param path: Target file, should end with the suffix of the compression from csv_suffixes
+        :param float_format: printf style format of the value columns for the faster format_csv, e.g. %.8g,
+                             None writes the full precision with DataFrame.to_csv
+        :param compression: None, 'gzip' or 'zstd' (requires the zstandard package)
+        :param block_rows: Number of rows formatted at once
+        """
+        if compression not in csv_suffixes:
+            raise ValueError(f"Compression '{compression}' not available")
+        self.path = path
+        self.float_format = float_format
+        self.compression = compression
+        self.block_rows = block_rows
+        self.rows = 0
+        self.seconds = 0.0
+        self.file = None
+        self._files = []
+
+    def __enter__(self):
+        if self.compression == "zstd":
+            import zstandard
+        self._files.append(open(self.path, "wb"))
+        if self.compression == "gzip":
+            # without file name and time in the header, the same sequence gives the same file
+            self._files.append(gzip.GzipFile(filename="", mode="wb", fileobj=self._files[-1], compresslevel=6,
+                                             mtime=0))
+        elif self.compression == "zstd":
+            self._files.append(zstandard.ZstdCompressor().stream_writer(self._files[-1], closefd=False))
+        # newline="" like DataFrame.to_csv with a path
+        self.file = io.TextIOWrapper(self._files[-1], encoding="utf-8", newline="")
+        return self
+
+    def __call__(self, chunk: pd.DataFrame):
+        start_time = time.perf_counter()
+        for start in range(0, len(chunk), self.block_rows):
+            block = chunk.iloc[start:start + self.block_rows]
+            if self.float_format is None:
+                block.to_csv(self.file, sep=",", index=False, header=self.rows == 0)
+            else:
+                self.file.write(format_csv(block, self.float_format, header=self.rows == 0))
+            self.rows += len(block)
+        self.seconds += time.perf_counter() - start_time
+
+    def __exit__(self, exc_type, *exc):
+        start_time = time.perf_counter()
+        self.file.close()
+        for f in reversed(self._files):
+            f.close()
+        self.seconds += time.perf_counter() - start_time
+        if exc_type is None and enabled():
+            # formatting and writing of all chunks, without the time the generator took in between
+            emit("write", format="csv", path=str(self.path), compression=self.compression, rows=self.rows,
+                 seconds=self.seconds, bytes=os.path.getsize(self.path))
+
+
+def write_csv(df: pd.DataFrame, path, float_format: str = None, compression: str = None):
+    """
+    Store a sequence as TimeEval CSV file, see CsvWriter for the options
+    """
+    with CsvWriter(path, float_format, compression) as writer:
+        writer(df)
+
+
+class NpzWriter:
+    """
+    Append the chunks of a sequence to the binary format of save_npz while it is generated
+    The rows of each member are spooled to a temporary file next to the target and copied into the
+    archive on exit, the file has the same members as save_npz of the whole sequence.
+    """
+
+    def __init__(self, path, value_dtype=np.float64):
+        self.path = Path(path)
+        self.value_dtype = value_dtype
+        self.rows = 0
+        self.seconds = 0.0
+        self.spool = None
+        self.members = {}
+
+    def __enter__(self):
+        self.spool = tempfile.mkdtemp(prefix=".spool-", dir=self.path.parent)
+        return self
+
+    def __call__(self, chunk: pd.DataFrame):
+        start_time = time.perf_counter()
+        for name, array in _npz_arrays(chunk, self.value_dtype).items():
+            if name in ("columns", "permutation_columns"):
+                self.members[name] = array
+                continue
+            if name not in self.members:
+                self.members[name] = (array.dtype, array.shape[1:], open(f"{self.spool}/{name}.npy", "wb"))
+            np.ascontiguousarray(array).tofile(self.members[name][2])
+        self.rows += len(chunk)
+        self.seconds += time.perf_counter() - start_time
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            for member in self.members.values():
+                if isinstance(member, tuple):
+                    member[2].close()
+            if exc_type is None:
+                start_time = time.perf_counter()
+                self._write()
+                self.seconds += time.perf_counter() - start_time
+        finally:
+            shutil.rmtree(self.spool, ignore_errors=True)
+        if exc_type is None and enabled():
+            emit("write", format="npz", path=str(self.path), rows=self.rows, seconds=self.seconds,
+                 bytes=os.path.getsize(self.path))
+
+    def _write(self):
+        with zipfile.ZipFile(self.path, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, member in self.members.items():
+                with archive.open(f"{name}.npy", "w", force_zip64=True) as f:
+                    if not isinstance(member, tuple):
+                        np.lib.format.write_array(f, member, allow_pickle=False)
+                        continue
+                    dtype, shape, _ = member
+                    np.lib.format.write_array_header_1_0(f, {"descr": np.lib.format.dtype_to_descr(dtype),
+                                                             "fortran_order": False,
+                                                             "shape": (self.rows, *shape)})
+                    with open(f"{self.spool}/{name}.npy", "rb") as spooled:
+                        shutil.copyfileobj(spooled, f, 2 ** 20)
+
+
+def load_npz(path, permutation=False, value_dtype=None) -> pd.DataFrame:
+    """
+    Load a sequence stored with save_npz
+    :param path: File to load
+    :param permutation: Include the permutation_* columns
+    :param value_dtype: Data type of the value columns, None keeps the stored one
+    :return: Sequence with the columns timestamp,value-0,value-1,…,is_anomaly
+    """
+    with np.load(path, allow_pickle=False) as data:
+        values = data["values"] if value_dtype is None else data["values"].astype(value_dtype, copy=False)
+        df = pd.DataFrame(values, columns=data["columns"].tolist())
+        df.insert(0, "timestamp", data["timestamp"])
+        if permutation:
+            for k, c in enumerate(data["permutation_columns"].tolist()):
+                df[c] = data[f"permutation-{k}"]
+        df["is_anomaly"] = data["is_anomaly"]
+    return df
+
+
+def map_npz(path, permutation=False):
+    """
+    Memory-map a sequence stored with save_npz without reading it
+    Slices of the returned arrays are read-only views on the file, the pages are loaded by the OS on access.
+    The file is mapped once, all arrays share the mapping and it is closed when the last of them is released.
+    :param path: File to map
+    :param permutation: Include the permutation_* columns
+    :return: Dict with timestamp, columns, values(rows, channels) and is_anomaly
+    """
+    # the permutation members are only mapped on request
+    members = _map_members(path, None if permutation else ["timestamp", "columns", "values", "is_anomaly"])
+    sequence = {
+        "timestamp": members["timestamp"],
+        "columns": members["columns"].tolist(),
+        "values": members["values"],
+        "is_anomaly": members["is_anomaly"],
+    }
+    if permutation:
+        for k, c in enumerate(members["permutation_columns"].tolist()):
+            sequence[c] = members[f"permutation-{k}"]
+    return sequence
+
+
+def file_mapping(array):
+    """
+    Mapping of the file an array of map_npz is a view on
+    :return: mmap object or None for arrays in memory
+    """
+    while isinstance(array, np.ndarray):
+        array = array.base
+    return array if isinstance(array, mmap.mmap) else None
+
+
+def _map_members(path, names=None):
+    """
+    Memory-map the members of an uncompressed npz file as read-only views on one mapping of the file
+    :param path: File to map
+    :param names: Members to map without the .npy suffix, all if None
+    :return: Dict of member name to array
+    """
+    members = {}
+    with zipfile.ZipFile(path) as archive, open(path, "rb") as f:
+        mapping = None
+        for info in archive.infolist():
+            name = info.filename[:-len(".npy")]
+            if names is not None and name not in names:
+                continue
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"Member {info.filename} of {path} is compressed and can not be memory-mapped")
+            # skip the local file header, its extra field can differ from the central directory
+            f.seek(info.header_offset)
+            name_length, extra_length = struct.unpack("<HH", f.read(30)[26:30])
+            f.seek(info.header_offset + 30 + name_length + extra_length)
+            version = np.lib.format.read_magic(f)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            if np.prod(shape) == 0:
+                members[name] = np.empty(shape, dtype=dtype)
+                continue
+            if mapping is None:
+                # one mapping and one file descriptor per file, not per member
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            members[name] = np.ndarray(shape, dtype=dtype, buffer=mapping, offset=f.tell(),
+                                       order="F" if fortran_order else "C")
+    return members
+
+
+def _overview_signature(files):
+    return {c.name: [c.stat().st_size, c.stat().st_mtime_ns] for c in files}
+
+
+def _parse_overviews(files):
+    configs = {}
+    for c in files:
+        with open(c, "r") as f:
+            config = yaml.load(f, Loader=YamlLoader)
+            name = list(filter(lambda x: "timeseries" in x, config.keys()))[0]
+            for sequence in config[name]:
+                sequence["origin"] = c.name
+                configs[sequence["name"]] = sequence
+    return configs
+
+
+def _is_permutation_list(permutation):
+    return isinstance(permutation, list) and all(isinstance(p, int) for p in permutation)
+
+
+def _write_overview_index(base_path: Path, signature, configs):
+    """
+    Store the parsed overviews as JSON, the permutation lists as members of an uncompressed npz file
+    """
+    permutations = {}
+    compiled = {}
+    for name, config in configs.items():
+        config = dict(config)
+        permutation = config.get("permutation")
+        if _is_permutation_list(permutation):
+            config["permutation"] = {"member": f"permutation-{len(permutations)}"}
+            permutations[config["permutation"]["member"]] = np.array(permutation, dtype=np.int64)
+        compiled[name] = config
+    content = json.dumps({"signature": signature, "configs": compiled})
+    # only index what survives the round trip, e.g. non-string keys would not
+    if json.loads(content)["configs"] != compiled:
+        return
+    for suffix, write in [(".npz", lambda f: np.savez(f, **permutations)),
+                          (".json", lambda f: f.write(content.encode()))]:
+        fd, temp = tempfile.mkstemp(suffix=suffix, dir=base_path)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            default_permissions(temp)
+            os.replace(temp, base_path / f"{overview_index_name}{suffix}")
+        except BaseException:
+            Path(temp).unlink(missing_ok=True)
+            raise
+
+
+def _read_overview_index(base_path: Path, signature):
+    try:
+        with open(base_path / f"{overview_index_name}.json", "r") as f:
+            index = json.load(f)
+        if index["signature"] != signature:
+            return None
+        permutations = _map_members(base_path / f"{overview_index_name}.npz")
+    except (OSError, ValueError, KeyError):
+        return None
+    configs = index["configs"]
+    for config in configs.values():
+        if isinstance(config.get("permutation"), dict):
+            config["permutation"] = permutations[config["permutation"]["member"]]
+    return configs
+
+
+def load_configs(base_path):
+    """
+    Generation configuration of all sequence groups listed in the overview*.yaml files of a suite
+    The parsed overviews are kept in a compiled index next to them that is rebuilt when any of them changes,
+    the permutation lists are returned as read-only int64 arrays, memory-mapped from the index if there is one.
+    :param base_path: Suite folder
+    :return: Dict of group name to configuration, the origin contains the name of the overview file
+    """
+    base_path = Path(base_path)
+    files = sorted(base_path.glob("*.yaml"))
+    signature = _overview_signature(files)
+    configs = _read_overview_index(base_path, signature)
+    if configs is not None:
+        return configs
+    configs = _parse_overviews(files)
+    try:
+        _write_overview_index(base_path, signature, configs)
+    except OSError:
+        # read-only suite folder, parse again next time
+        pass
+    # the same types as read from the index
+    for config in configs.values():
+        if _is_permutation_list(config.get("permutation")):
+            config["permutation"] = np.array(config["permutation"], dtype=np.int64)
+            config["permutation"].flags.writeable = False
+    return configs
+
+
+def file_sha256(path, chunk_size: int = 1024 ** 2):
+    """
+    SHA-256 hex digest of a file, read in chunks
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_entry(path, sha256: str = None):
+    """
+    Size, modification time and SHA-256 of a file for a manifest
+    :param path: File
+    :param sha256: Already known SHA-256 of the file, computed if None
+    """
+    stat = Path(path).stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256 or file_sha256(path)}
+
+
+def build_manifest(base_path, names=None):
+    """
+    List the files of a suite folder with their sizes, modification times and SHA-256, hidden files are left out
+    :param base_path: Suite folder
+    :param names: Only list these overview files and sequence groups, all if None
+    :return: Dict with the overview files and the files of every sequence group by their path in the suite folder
+    """
+    base_path = Path(base_path)
+    manifest = {"files": {}, "groups": {}}
+    for p in sorted(base_path.iterdir()):
+        if p.name.startswith(".") or (names is not None and p.name not in names):
+            continue
+        if p.is_file() and p.suffix == ".yaml":
+            manifest["files"][p.name] = manifest_entry(p)
+        elif p.is_dir():
+            manifest["groups"][p.name] = {f"{p.name}/{f.name}": manifest_entry(f) for f in sorted(p.iterdir())
+                                          if f.is_file() and not f.name.startswith(".")}
+    return manifest
+
+
+def read_manifest(base_path):
+    """
+    Manifest of a suite folder, None if it has none
+    """
+    try:
+        with open(Path(base_path) / manifest_name, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def verify_manifest(base_path, manifest, level: str = "stat"):
+    """
+    Check the files of a suite folder against its manifest
+    Entries of files that changed only their modification time are updated in the manifest.
+    :param base_path: Suite folder
+    :param manifest: Manifest of the folder
+    :param level: 'stat' compares sizes and modification times and hashes files with another modification time,
+                  'hash' compares the SHA-256 of every file
+    :return: Names of the overview files and sequence groups with missing or changed files
+    """
+    if level not in ("stat", "hash"):
+        raise ValueError(f"Verification level '{level}' not available")
+    base_path = Path(base_path)
+
+    def _intact(path, entry):
+        p = base_path / path
+        if not p.is_file() or p.stat().st_size != entry["size"]:
+            return False
+        if level == "stat" and p.stat().st_mtime_ns == entry.get("mtime_ns"):
+            return True
+        if file_sha256(p) != entry["sha256"]:
+            return False
+        entry["mtime_ns"] = p.stat().st_mtime_ns
+        return True
+
+    broken = [name for name, entry in manifest["files"].items() if not _intact(name, entry)]
+    broken += [group for group, files in manifest["groups"].items()
+               if not all(_intact(path, entry) for path, entry in files.items())]
+    return broken
+
+
+def write_manifest(base_path, manifest=None):
+    """
+    Store the manifest of a suite folder as manifest.json in it
+    :param base_path: Suite folder
+    :param manifest: Manifest to store, built from the folder if None
+    """
+    base_path = Path(base_path)
+    if manifest is None:
+        manifest = build_manifest(base_path)
+    fd, temp = tempfile.mkstemp(suffix=".json", dir=base_path)
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=1)
+        default_permissions(temp)
+        os.replace(temp, base_path / manifest_name)
+    except BaseException:
+        Path(temp).unlink(missing_ok=True)
+        raise
+
+
+def export_csv(path, overwrite=False, float_format=None, compression=None):
+    """
+    Export all binary stored sequences below path to TimeEval compatible CSV files
+    :param path: Suite or sequence group folder
+    :param overwrite: Replace already existing CSV files
+    :param float_format: printf style format of the value columns, e.g. %.8g, None for the full precision
+    :param compression: None, 'gzip' or 'zstd'
+    """
+    for p in sorted(Path(path).glob("**/*.npz")):
+        target = Path(f"{p.with_suffix('')}{csv_suffixes[compression]}")
+        if target.exists() and not overwrite:
+            continue
+        print(f"Exporting {target}")
+        write_csv(load_npz(p, permutation=True), target, float_format, compression)
+
+
+def export_npz(path, overwrite=False, value_dtype=np.float64):
+    """
+    Convert all CSV stored sequences below path to the binary format, e.g. for memory-mapped loading
+    :param path: Suite or sequence group folder
+    :param overwrite: Replace already existing binary files
+    :param value_dtype: Data type of the value columns
+    """
+    for suffix in csv_suffixes.values():
+        for p in sorted(Path(path).glob(f"**/*{suffix}")):
+            target = Path(f"{str(p)[:-len(suffix)]}.npz")
+            if target.exists() and not overwrite:
+                continue
+            print(f"Exporting {target}")
+            save_npz(pd.read_csv(p), target, value_dtype)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("path", type=str,
+                        help="Suite or sequence group folder to export the stored sequences of")
+    parser.add_argument("--to", type=str, default="csv", choices=['csv', 'npz', 'manifest'],
+                        help="Target format: TimeEval 'csv' from the binary files, binary 'npz' from the CSV files "
+                             "or the 'manifest' of a suite folder to download single sequence groups")
+    parser.add_argument("--overwrite", type=str, default="no",
+                        help="Replace already existing files: 'yes' or 'no'")
+    parser.add_argument("--float_format", type=str, default=None,
+                        help="printf style format of the exported CSV values, e.g. %%.8g, full precision without it")
+    parser.add_argument("--compression", type=str, default="none", choices=['none', 'gzip', 'zstd'],
+                        help="Compression of the exported CSV files: 'none', 'gzip' or 'zstd'")
+    args = parser.parse_args()
+    if args.to == "csv":
+        export_csv(args.path, args.overwrite == "yes", args.float_format,
+                   None if args.compression == "none" else args.compression)
+    elif args.to == "npz":
+        export_npz(args.path, args.overwrite == "yes")
+    else:
+        write_manifest(args.path)
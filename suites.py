@@ -0,0 +1,115 @@
+import hashlib
+import inspect
+
+from generators import *
+
+# Suite definitions and the planning of their generation tasks, importing them does not touch the random streams
+
+# [3]
+SIMPLE_INCREASING = [
+    generate_simple_increasing_data,
+    generate_saw_data,
+    generate_4_saw_data,
+]
+
+# [12]
+STD_CUT_INCREASING = [
+    *[generate_std_cut_increasing_data_dynamic(2, i) for i in [10, 40, 70]],
+    *[generate_std_cut_increasing_data_dynamic(3, i) for i in [10, 40, 70]],
+    *[generate_std_cut_continue_increasing_data_dynamic(2, i) for i in [10, 30, 50]],
+    *[generate_std_cut_continue_increasing_data_dynamic(3, i) for i in [10, 30, 50]]
+]
+
+# [8]
+WAVE = [
+    generate_simple_wave_data,
+    generate_synced_wave_data,
+    generate_off_synced_wave_data,
+    generate_light_off_synced_wave_data,
+    # 4
+    generate_4_simple_wave_data,
+    generate_no_synced_cut_wave_data,
+    generate_medium_past_std_cut_wave_data,
+    generate_big_past_std_cut_wave_data
+]
+
+# [5]
+# Published version of this sequences can not be regenerated
+# They were added later and not in a full generation run
+CORRELATION = [
+    generate_correlation_data,
+    generate_correlation_2_data,
+    generate_correlation_2_trend_data,
+    generate_correlation_2_trend_strong_data,
+    # 4
+    generate_correlation_2_high_corr_data
+]
+
+# [6]
+STD_CUT_WAVE = [
+    generate_std_cut_wave_data_dynamic(sequences, pre_std_ration, pre_std_past)
+    for sequences in [2, 4]
+    for pre_std_ration in [2]
+    for pre_std_past in [10, 30, 70]]
+
+# [34]
+ALL_BASE = [*SIMPLE_INCREASING, *WAVE, *STD_CUT_INCREASING, *STD_CUT_WAVE, *CORRELATION]
+
+# [4]
+PREDATOR_PRAY = [
+    generate_4_3_prey_2_predator_500_cooldown_1_mil_steps,
+    generate_4_3_prey_2_predator_300_cooldown_short,
+    generate_4_2_prey_2_predator_1000_cooldown_1_mil_steps,
+    generate_4_2_prey_2_predator_300_cooldown_short
+]
+
+ALL_ADVANCED = [*PREDATOR_PRAY]
+
+suite_config = {
+    "FSB": ALL_BASE,
+    "SRB": ALL_ADVANCED
+}
+
+# stored sequences per group and the generator arguments to create them, in generation order
+VARIANTS = {
+    "train_anomaly": {},
+    "train_no_anomaly": {"anomaly": False},
+    "test": {},
+}
+
+
+def generator_key(f):
+    """
+    Stable identifier of a suite entry, closures of the dynamic generators include their parameters
+    """
+    closure = tuple(c.cell_contents for c in f.__closure__ or ())
+    return f"{f.__qualname__}{closure}" if closure else f.__qualname__
+
+
+def task_seed(seed, key, variant):
+    """
+    Deterministic seed of one generation task derived from the global seed, independent of the execution order
+    """
+    digest = hashlib.sha256(f"{seed}/{key}/{variant}".encode()).digest()
+    return int.from_bytes(digest[:4], "little")
+
+
+def plan_variants(f):
+    """
+    Variants a suite entry needs, generators without an anomaly switch have no clean training sequence
+    """
+    if "anomaly" in inspect.signature(f).parameters:
+        return list(VARIANTS)
+    return [variant for variant, kwargs in VARIANTS.items() if "anomaly" not in kwargs]
+
+
+def plan_suite(suite, seed=None):
+    """
+    Declare all generation tasks of a suite up front, each variant of each entry is generated exactly once
+    :param suite: Name of the benchmark suite: 'FSB' or 'SRB'
+    :param seed: Global seed to derive an independent seed per task from,
+                 None runs the tasks in order on the global random stream
+    :return: List of (index, variant, seed)
+    """
+    return [(i, variant, None if seed is None else task_seed(seed, generator_key(f), variant))
+            for i, f in enumerate(suite_config[suite]) for variant in plan_variants(f)]
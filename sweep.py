@@ -0,0 +1,138 @@
+import copy
+import hashlib
+import itertools
+import os
+import random
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import yaml
+from tqdm import tqdm
+
+from generators import generate_std_cut_increasing_batch, generate_std_cut_increasing_data
+from storage import default_permissions, save_npz
+from suites import VARIANTS, plan_variants, task_seed
+
+# generator families with a batch implementation that computes many parameter points at once
+# the std cut wave family has none, the time of every value after a cut depends on the std of the values before it,
+# the points of a grid drift apart at the first cut and cannot share one stacked array
+batched_families = {
+    generate_std_cut_increasing_data: generate_std_cut_increasing_batch,
+}
+sweep_key = "sweep-timeseries"
+
+
+def expand_grid(grid):
+    """
+    All parameter points of a grid in a stable order
+    :param grid: Dict of generator argument to the list of its values
+    :return: List of dicts with one value per argument
+    """
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*[grid[k] for k in keys])]
+
+
+def _format_value(value):
+    if isinstance(value, (list, tuple)):
+        return "_".join(_format_value(v) for v in value)
+    if isinstance(value, float):
+        return f"{value:g}"
+    return str(value).replace("/", "_").replace(" ", "")
+
+
+def point_name(family, point):
+    """
+    Deterministic group name of a parameter point, e.g. std_cut_increasing-std_past_10_10-std_ratio_2_2
+    Long names are shortened to the family and a hash of the full name.
+    """
+    prefix = family.__name__.removeprefix("generate_").removesuffix("_data")
+    name = "-".join([prefix, *[f"{k}_{_format_value(v)}" for k, v in point.items()]])
+    if len(name) > 128:
+        name = f"{prefix}-{hashlib.sha256(name.encode()).hexdigest()[:16]}"
+    return name
+
+
+def _generate_points(family, points, seeds, kwargs):
+    batch = batched_families.get(family)
+    if batch is not None:
+        return batch(points, seeds, **kwargs)
+    results = []
+    for point, seed in zip(points, seeds):
+        random.seed(seed)
+        np.random.seed(seed)
+        results.append(family(**point, **kwargs, plot=False))
+    return results
+
+
+def _write_atomic(path: Path, write):
+    fd, temp = tempfile.mkstemp(suffix=path.suffix, dir=path.parent)
+    os.close(fd)
+    try:
+        write(temp)
+        default_permissions(temp)
+        os.replace(temp, path)
+    except BaseException:
+        Path(temp).unlink(missing_ok=True)
+        raise
+
+
+def sweep(family, grid, path, fixed=None, seed=42, batch_size=64, formats=("csv",), value_dtype="float64"):
+    """
+    Generate a sequence group for every point of a parameter grid
+    Each point gets the train/test variants of the suites with seeds derived from the global seed and its name.
+    Points are generated in batches, families in batched_families compute a whole batch as one stacked array,
+    all other families, e.g. the std cut wave ones, generate the points of a batch one after the other.
+    The overview.yaml of the sweep folder is updated after every batch and lists the finished points only,
+    running the same sweep again continues with the missing points.
+    :param family: Generator function, e.g. generate_std_cut_increasing_data
+    :param grid: Dict of generator argument to the list of its values
+    :param path: Folder of the sweep, one sub folder per point
+    :param fixed: Generator arguments shared by all points, not part of the group names
+    :param seed: Global seed of the sweep
+    :param batch_size: Number of points generated and written at once
+    :param formats: File formats to store: 'csv' and/or 'npz'
+    :param value_dtype: Data type of the value columns in the binary format
+    :return: List of the group names of all points
+    """
+    path = Path(path)
+    path.mkdir(parents=True, exist_ok=True)
+    overview = path / "overview.yaml"
+    configs = {sweep_key: []}
+    if overview.exists():
+        with open(overview, "r") as f:
+            configs = yaml.safe_load(f)
+    done = {c["name"] for c in configs[sweep_key]}
+
+    # separate copies per point, shared lists would be dumped as YAML aliases
+    points = [(copy.deepcopy({**(fixed or {}), **point}), point_name(family, point)) for point in expand_grid(grid)]
+    pending = [(point, name) for point, name in points if name not in done]
+    variants = plan_variants(family)
+
+    for b in tqdm(range(0, len(pending), batch_size)):
+        batch = pending[b:b + batch_size]
+        results = {}
+        for variant in variants:
+            seeds = [task_seed(seed, name, variant) for _, name in batch]
+            # some generators change their list arguments in place
+            results[variant] = _generate_points(family, [copy.deepcopy(point) for point, _ in batch], seeds,
+                                                VARIANTS[variant])
+        for k, (point, name) in enumerate(batch):
+            Path(path / name).mkdir(exist_ok=True)
+            for variant in variants:
+                df = results[variant][k][0]
+                if "csv" in formats:
+                    _write_atomic(path / name / f"{variant}.csv", lambda p: df.to_csv(p, sep=",", index=False))
+                if "npz" in formats:
+                    _write_atomic(path / name / f"{variant}.npz", lambda p: save_npz(df, p, value_dtype))
+            params = results[variants[0]][k][1]
+            params["name"] = name
+            params["point"] = copy.deepcopy(point)
+            configs[sweep_key].append(params)
+
+        def _dump(p):
+            with open(p, "w") as f:
+                yaml.dump(configs, f, allow_unicode=True)
+        _write_atomic(overview, _dump)
+
+    return [name for _, name in points]